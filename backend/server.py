@@ -3,6 +3,7 @@
 
 import io
 import os
+import codecs
 import json
 import asyncio
 import aiohttp
@@ -16,7 +17,10 @@ from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import hashlib
+import functools
 import shutil
+import stat
+import tempfile
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 import uuid
@@ -30,6 +34,12 @@ try:
     import psutil  # optional
 except Exception:
     psutil = None  # type: ignore
+try:
+    import orjson  # optional, faster JSON parsing
+    _json_loads = orjson.loads
+except Exception:
+    orjson = None  # type: ignore
+    _json_loads = json.loads
 import subprocess
 import threading
 import sys
@@ -183,77 +193,66 @@ def _max_sample_res_for_vram(v: str) -> Optional[int]:
     return None
 
 
-def _cap_width_height_in_toml(src: str, max_res: Optional[int]) -> str:
-    if not max_res:
-        return src
-    out_lines: list[str] = []
+def _build_prompt_toml_single_pass(src: str, max_res: Optional[int], convert: bool = False) -> str:
+    """Rewrite sample prompt TOML in a single walk over its lines.
+    Renames 'text' keys to 'prompt' and caps width/height at max_res. With convert=True the
+    simple [[prompt]] blocks are also regrouped into the [prompt] / [[prompt.subset]] layout.
+    """
+    capped = _round16(max_res) if max_res else None
+    out: list[str] = ['[prompt]'] if convert else []
+    block_pending = True
     for ln in src.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
         s = ln.strip()
-        if s.startswith('width') and '=' in s:
-            try:
-                val = int(s.split('=')[1].strip())
-                if val > max_res:
-                    ln = f"width = {_round16(max_res)}"
-            except Exception:
-                pass
-        elif s.startswith('height') and '=' in s:
+        if convert:
+            if not s:
+                continue
+            if s.startswith('[[prompt]]'):
+                block_pending = True
+                continue
+            # collect k = v lines only
+            if '=' not in s or s.startswith('#'):
+                continue
+            # Emit the subset header lazily so empty blocks are dropped
+            if block_pending:
+                out.append('')
+                out.append('[[prompt.subset]]')
+                block_pending = False
+            ln = s
+        if s.startswith('text') and '=' in s:
+            ln = f"prompt ={s.split('=', 1)[1]}"
+        elif capped and (s.startswith('width') or s.startswith('height')) and '=' in s:
             try:
-                val = int(s.split('=')[1].strip())
-                if val > max_res:
-                    ln = f"height = {_round16(max_res)}"
+                if int(s.split('=')[1].strip()) > max_res:
+                    ln = f"{'width' if s.startswith('width') else 'height'} = {capped}"
             except Exception:
                 pass
-        out_lines.append(ln)
-    return '\n'.join(out_lines)
-
-
-def _convert_simple_prompt_toml(src: str) -> str:
-    lines = src.replace('\r\n', '\n').replace('\r', '\n').split('\n')
-    blocks: list[list[str]] = []
-    current: list[str] | None = None
-    for ln in lines:
-        s = ln.strip()
-        if not s:
-            continue
-        if s.startswith('[[prompt]]'):
-            if current:
-                blocks.append(current)
-            current = []
-            continue
-        # collect k = v lines only
-        if '=' in s and not s.startswith('#'):
-            if current is None:
-                current = []
-            # normalize 'text' -> 'prompt'
-            if s.startswith('text'):
-                key, val = s.split('=', 1)
-                s = f"prompt ={val}"
-            current.append(s)
-    if current:
-        blocks.append(current)
-    # Build target TOML
-    out: list[str] = []
-    out.append('[prompt]')
-    for blk in blocks:
+        out.append(ln)
+    if convert:
         out.append('')
-        out.append('[[prompt.subset]]')
-        out.extend(blk)
-    out.append('')
     return '\n'.join(out)
 
 
-def _rename_text_key_in_toml(src: str) -> str:
-    out_lines: list[str] = []
-    for ln in src.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
-        s = ln.strip()
-        if s.startswith('text') and '=' in s:
-            try:
-                _, val = s.split('=', 1)
-                ln = f"prompt ={val}"
-            except Exception:
-                pass
-        out_lines.append(ln)
-    return '\n'.join(out_lines)
+@functools.lru_cache(maxsize=64)
+def _build_prompt_toml(sps: str, max_res: Optional[int]) -> tuple[Optional[str], str]:
+    """Return (converted_text, extension) for stripped sample prompt text.
+    converted_text is None when the prompts should be written as-is.
+    """
+    head = sps[:2]
+    if head == '[[' and sps.startswith('[[prompt]]'):
+        # Our UI may send a simple TOML array-of-tables format ([[prompt]] ...)
+        # sd-scripts expects [prompt] with [[prompt.subset]] entries.
+        # Convert here to avoid runtime errors in load_prompts.
+        try:
+            return _build_prompt_toml_single_pass(sps, max_res, convert=True), 'toml'
+        except Exception:
+            # Fall back to original text if conversion fails
+            return _build_prompt_toml_single_pass(sps, max_res), 'toml'
+    # [[prompt.subset]] may follow leading comments, so that check is not gated on the head
+    if (head == '[p' and sps.startswith('[prompt]')) or '[[prompt.subset]]' in sps:
+        return _build_prompt_toml_single_pass(sps, max_res), 'toml'
+    if head[:1] in ('{', '['):
+        return None, 'json'
+    return None, 'txt'
 
 # Global model status tracking
 MODEL_STATUS = {}  # repo_id -> {"status": "downloading|loaded|error", "progress": 0-100, "message": "..."}
@@ -261,6 +260,10 @@ MODEL_CACHE = {}  # repo_id -> (model, processor) - keep loaded models in memory
 
 # Training runs tracking
 RUNS: Dict[str, Dict[str, Any]] = {}
+# Per-run log buffer budget; oldest output is dropped beyond this
+RUN_LOG_MAX_BYTES = 2 * 1024 * 1024
+# Seconds a TE-warmup phase 1 gets to exit after SIGTERM before it is killed
+PHASE1_STOP_TIMEOUT = 30.0
 
 # Preset prompt templates for Qwen VL
 QWEN_PRESET_PROMPTS = {
@@ -2595,10 +2598,54 @@ def format_file_size(size_bytes: int) -> str:
 # Training endpoints (prepare/start/stop/logs)
 # ---------------------------
 
+# Read once at import (os.umask can only be read by setting it); new files from
+# _atomic_write get the same mode a plain open() would give them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _atomic_write(path: str, text: str) -> None:
+    """Write text via a temp file + rename so readers never see a partial file."""
+    try:
+        # Keep the existing mode, e.g. the exec bit on a generated train.sh
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    # Unique temp name per call: concurrent prepares of one output don't share it
+    tmp = tempfile.NamedTemporaryFile(
+        "w",
+        encoding="utf-8",
+        dir=os.path.dirname(path) or ".",
+        prefix=f".{os.path.basename(path)}.",
+        suffix=".tmp",
+        delete=False,
+    )
+    try:
+        with tmp as f:
+            f.write(text)
+        os.chmod(tmp.name, mode)
+        os.replace(tmp.name, path)
+    finally:
+        # Only still there if writing or renaming failed
+        try:
+            os.unlink(tmp.name)
+        except FileNotFoundError:
+            pass
+
+
+def _preferred_mixed_precision() -> str:
+    try:
+        return 'bf16' if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else 'fp16'
+    except Exception:
+        return 'bf16'
+
+
 @app.post("/api/train/prepare")
-def api_train_prepare(payload: Dict[str, Any]):
+async def api_train_prepare(payload: Dict[str, Any]):
     try:
-        ok_utils, msg_utils = ensure_train_utils()
+        # Everything that can block (imports, CUDA probe, model dir walk in gen_sh,
+        # file writes) runs in worker threads so other requests and streams keep going
+        ok_utils, msg_utils = await asyncio.to_thread(ensure_train_utils)
         if not ok_utils:
             return JSONResponse({"ok": False, "message": "training utilities unavailable", "detail": msg_utils}, status_code=500)
 
@@ -2731,146 +2778,18 @@ def api_train_prepare(payload: Dict[str, Any]):
         # Decide sample prompts path ext
         sp_ext = 'txt'
         converted_sample_prompts = None
-
-        def _max_sample_res_for_vram(v: str) -> int | None:
-            v = str(v or '').upper().replace('B', '')
-            if v.startswith('12'):
-                return 512
-            if v.startswith('16'):
-                return 640
-            if v.startswith('20'):
-                return 768
-            if v.startswith('24'):
-                return 768
-            return None
-
-        def _round16(x: int) -> int:
-            return max(64, (int(x) // 16) * 16)
-
-        def _cap_width_height_in_toml(src: str, max_res: int | None) -> str:
-            if not max_res:
-                return src
-            out_lines: list[str] = []
-            for ln in src.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
-                s = ln.strip()
-                if s.startswith('width') and '=' in s:
-                    try:
-                        val = int(s.split('=')[1].strip())
-                        if val > max_res:
-                            ln = f"width = {_round16(max_res)}"
-                    except Exception:
-                        pass
-                elif s.startswith('height') and '=' in s:
-                    try:
-                        val = int(s.split('=')[1].strip())
-                        if val > max_res:
-                            ln = f"height = {_round16(max_res)}"
-                    except Exception:
-                        pass
-                out_lines.append(ln)
-            return '\n'.join(out_lines)
-
-        def _max_sample_res_for_vram(v: str) -> int | None:
-            v = str(v or '').upper().replace('B', '')
-            if v.startswith('12'):
-                return 512
-            if v.startswith('16'):
-                return 640
-            if v.startswith('20'):
-                return 768
-            if v.startswith('24'):
-                return 768
-            return None
-
-        def _round16(x: int) -> int:
-            return max(64, (int(x) // 16) * 16)
-
-        def _cap_width_height_in_toml(src: str, max_res: int | None) -> str:
-            if not max_res:
-                return src
-            out_lines: list[str] = []
-            for ln in src.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
-                s = ln.strip()
-                if s.startswith('width') and '=' in s:
-                    try:
-                        val = int(s.split('=')[1].strip())
-                        if val > max_res:
-                            ln = f"width = {_round16(max_res)}"
-                    except Exception:
-                        pass
-                elif s.startswith('height') and '=' in s:
-                    try:
-                        val = int(s.split('=')[1].strip())
-                        if val > max_res:
-                            ln = f"height = {_round16(max_res)}"
-                    except Exception:
-                        pass
-                out_lines.append(ln)
-            return '\n'.join(out_lines)
         if isinstance(sample_prompts, str):
+            max_res = _max_sample_res_for_vram(vram)
             sps = sample_prompts.strip()
-            if sps.startswith('[[prompt]]'):
-                # Our UI may send a simple TOML array-of-tables format ([[prompt]] ...)
-                # sd-scripts expects [prompt] with [[prompt.subset]] entries.
-                # Convert here to avoid runtime errors in load_prompts.
-                sp_ext = 'toml'
-
-                def _convert_simple_prompt_toml(src: str) -> str:
-                    lines = src.replace('\r\n', '\n').replace('\r', '\n').split('\n')
-                    blocks: list[list[str]] = []
-                    current: list[str] | None = None
-                    for ln in lines:
-                        s = ln.strip()
-                        if not s:
-                            continue
-                        if s.startswith('[[prompt]]'):
-                            if current:
-                                blocks.append(current)
-                            current = []
-                            continue
-                        # collect k = v lines only
-                        if '=' in s and not s.startswith('#'):
-                            if current is None:
-                                current = []
-                            current.append(s)
-                    if current:
-                        blocks.append(current)
-                    # Build target TOML
-                    out: list[str] = []
-                    out.append('[prompt]')
-                    for blk in blocks:
-                        out.append('')
-                        out.append('[[prompt.subset]]')
-                        out.extend(blk)
-                    out.append('')
-                    return '\n'.join(out)
-
-                try:
-                    converted_sample_prompts = _cap_width_height_in_toml(
-                        _rename_text_key_in_toml(_convert_simple_prompt_toml(sps)), _max_sample_res_for_vram(vram)
-                    )
-                except Exception:
-                    # Fall back to original text if conversion fails
-                    converted_sample_prompts = _cap_width_height_in_toml(
-                        _rename_text_key_in_toml(sps), _max_sample_res_for_vram(vram)
-                    )
-            elif sps.startswith('[prompt]') or '[[prompt.subset]]' in sps:
-                sp_ext = 'toml'
-                converted_sample_prompts = _cap_width_height_in_toml(
-                    _rename_text_key_in_toml(sps), _max_sample_res_for_vram(vram)
-                )
-            elif sps.startswith('{') or sps.startswith('['):
-                sp_ext = 'json'
+            converted_sample_prompts, sp_ext = _build_prompt_toml(sps, max_res)
         sp_path = tu_resolve_path_without_quotes(f"outputs/{output_name}/sample_prompts.{sp_ext}")
 
         # Decide mixed precision based on hardware support (bf16 preferred)
-        try:
-            mp = 'bf16' if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else 'fp16'
-        except Exception:
-            mp = 'bf16'
+        mp = await asyncio.to_thread(_preferred_mixed_precision)
 
         # Phase 1: possibly with TE training
-        sh_text = tu_gen_sh(
+        sh_text = await asyncio.to_thread(
+            tu_gen_sh,
             base_model,
             output_name,
             resolution,
@@ -2906,7 +2825,8 @@ def api_train_prepare(payload: Dict[str, Any]):
             mixed_precision=mp,
         )
         dataset_folder = payload.get("dataset_folder") or f"datasets/{output_name}"
-        toml_text = tu_gen_toml(
+        toml_text = await asyncio.to_thread(
+            tu_gen_toml,
             dataset_folder,
             resolution,
             class_tokens,
@@ -2922,26 +2842,22 @@ def api_train_prepare(payload: Dict[str, Any]):
         )
 
         out_dir = tu_resolve_path_without_quotes(f"outputs/{output_name}")
-        os.makedirs(out_dir, exist_ok=True)
+        await asyncio.to_thread(os.makedirs, out_dir, exist_ok=True)
         file_type = "bat" if os.name == "nt" else "sh"
         sh_path = tu_resolve_path_without_quotes(f"outputs/{output_name}/train.{file_type}")
         # Override handled directly inside gen_sh when pretrained_path is provided
-        with open(sh_path, "w", encoding="utf-8") as f:
-            f.write(sh_text)
         ds_path = tu_resolve_path_without_quotes(f"outputs/{output_name}/dataset.toml")
-        with open(ds_path, "w", encoding="utf-8") as f:
-            f.write(toml_text)
-        # Write sample prompts with chosen extension
-        with open(sp_path, "w", encoding="utf-8") as f:
-            if converted_sample_prompts is not None:
-                f.write(converted_sample_prompts)
-            else:
-                f.write(sample_prompts)
+        # Write script, dataset config and sample prompts (with chosen extension) concurrently
+        await asyncio.gather(
+            asyncio.to_thread(_atomic_write, sh_path, sh_text),
+            asyncio.to_thread(_atomic_write, ds_path, toml_text),
+            asyncio.to_thread(_atomic_write, sp_path, converted_sample_prompts if converted_sample_prompts is not None else sample_prompts),
+        )
 
         run_id = str(uuid.uuid4())
         run_info = {
             "status": "prepared",
-            "logs": [],
+            "logs": bytearray(),
             "output_name": output_name,
             "base_model": base_model,
             "sh_path": sh_path,
@@ -2949,7 +2865,8 @@ def api_train_prepare(payload: Dict[str, Any]):
         }
         # Prepare phase 2 (UNet-only) if TE warmup requested
         if (train_clip_l or train_t5xxl) and te_warmup_steps and te_warmup_steps > 0:
-            sh2_text = tu_gen_sh(
+            sh2_text = await asyncio.to_thread(
+                tu_gen_sh,
                 base_model,
                 output_name,
                 resolution,
@@ -2983,8 +2900,7 @@ def api_train_prepare(payload: Dict[str, Any]):
                 text_encoder_lr=None,
             )
             sh2_path = tu_resolve_path_without_quotes(f"outputs/{output_name}/train_phase2.sh")
-            with open(sh2_path, "w", encoding="utf-8") as f2:
-                f2.write(sh2_text)
+            await asyncio.to_thread(_atomic_write, sh2_path, sh2_text)
             run_info.update({
                 "te_phase": 1,
                 "te_warmup_steps": te_warmup_steps,
@@ -3008,6 +2924,12 @@ def api_train_prepare(payload: Dict[str, Any]):
         print("[ERROR] /api/train/prepare failed:\n", tb)
         return JSONResponse({"ok": False, "error": str(e), "trace": tb}, status_code=500)
 
+def _write_caption_sidecars(captions: list[tuple[Path, str]]) -> None:
+    for txt_path, caption in captions:
+        with open(txt_path, 'w') as tf:
+            tf.write(caption)
+
+
 @app.post("/api/train/prepare-upload")
 async def api_train_prepare_upload(
     base_model: str = Form(...),
@@ -3067,77 +2989,33 @@ async def api_train_prepare_upload(
 
         # Save uploaded images + captions
         try:
-            caps = json.loads(captions or "[]")
+            caps = _json_loads(captions or "[]")
         except Exception:
             caps = []
         if images:
+            ct = (class_tokens or '').strip().strip(',')
+            prefix = f"{ct}, " if ct else ''
+            # sd-scripts needs one caption sidecar per image; collect them and write in one batch
+            captions_to_write: list[tuple[Path, str]] = []
             for idx, uf in enumerate(images):
                 content = await uf.read()
                 fname = uf.filename or f"img_{idx}.png"
                 out_path = Path(ds_abs) / fname
                 with open(out_path, 'wb') as f:
                     f.write(content)
-                # Write caption sidecar
                 cap_text = ''
                 if idx < len(caps):
                     cap_text = str(caps[idx] or '')
-                ct = (class_tokens or '').strip().strip(',')
-                prefix = f"{ct}, " if ct else ''
-                full_caption = f"{prefix}{cap_text}".strip()
-                with open(out_path.with_suffix('.txt'), 'w') as tf:
-                    tf.write(full_caption)
+                captions_to_write.append((out_path.parent / (out_path.stem + '.txt'), f"{prefix}{cap_text}".strip()))
+            await asyncio.to_thread(_write_caption_sidecars, captions_to_write)
 
         # Decide sample prompts path ext
         sp_ext = 'txt'
         converted_sample_prompts = None
         if isinstance(sample_prompts, str):
+            max_res = _max_sample_res_for_vram(vram)
             sps = sample_prompts.strip()
-            if sps.startswith('[[prompt]]'):
-                sp_ext = 'toml'
-
-                def _convert_simple_prompt_toml(src: str) -> str:
-                    lines = src.replace('\r\n', '\n').replace('\r', '\n').split('\n')
-                    blocks: list[list[str]] = []
-                    current: list[str] | None = None
-                    for ln in lines:
-                        s = ln.strip()
-                        if not s:
-                            continue
-                        if s.startswith('[[prompt]]'):
-                            if current:
-                                blocks.append(current)
-                            current = []
-                            continue
-                        if '=' in s and not s.startswith('#'):
-                            if current is None:
-                                current = []
-                            current.append(s)
-                    if current:
-                        blocks.append(current)
-                    out: list[str] = []
-                    out.append('[prompt]')
-                    for blk in blocks:
-                        out.append('')
-                        out.append('[[prompt.subset]]')
-                        out.extend(blk)
-                    out.append('')
-                    return '\n'.join(out)
-
-                try:
-                    converted_sample_prompts = _cap_width_height_in_toml(
-                        _rename_text_key_in_toml(_convert_simple_prompt_toml(sps)), _max_sample_res_for_vram(vram)
-                    )
-                except Exception:
-                    converted_sample_prompts = _cap_width_height_in_toml(
-                        _rename_text_key_in_toml(sps), _max_sample_res_for_vram(vram)
-                    )
-            elif sps.startswith('[prompt]') or '[[prompt.subset]]' in sps:
-                sp_ext = 'toml'
-                converted_sample_prompts = _cap_width_height_in_toml(
-                    _rename_text_key_in_toml(sps), _max_sample_res_for_vram(vram)
-                )
-            elif sps.startswith('{') or sps.startswith('['):
-                sp_ext = 'json'
+            converted_sample_prompts, sp_ext = _build_prompt_toml(sps, max_res)
         sp_path = tu_resolve_path_without_quotes(f"outputs/{lora_name}/sample_prompts.{sp_ext}")
 
         # Build payload
@@ -3166,33 +3044,24 @@ async def api_train_prepare_upload(
             "train_batch_size": train_batch_size,
             "dataset_folder": ds_folder,
         }
-        if blocks_to_swap is not None:
-            payload["blocks_to_swap"] = blocks_to_swap
-        if pretrained_path:
-            payload["pretrained_path"] = pretrained_path
-        if lr_scheduler is not None:
-            payload["lr_scheduler"] = lr_scheduler
-        if lr_warmup_steps is not None:
-            payload["lr_warmup_steps"] = lr_warmup_steps
-        if noise_offset is not None:
-            payload["noise_offset"] = noise_offset
-        if flip_aug is not None:
-            payload["flip_aug"] = flip_aug
-        if network_dropout is not None:
-            payload["network_dropout"] = network_dropout
-        # Bucketing
-        if enable_bucket is not None:
-            payload["enable_bucket"] = enable_bucket
-        if min_bucket_reso is not None:
-            payload["min_bucket_reso"] = min_bucket_reso
-        if max_bucket_reso is not None:
-            payload["max_bucket_reso"] = max_bucket_reso
-        if bucket_reso_steps is not None:
-            payload["bucket_reso_steps"] = bucket_reso_steps
-        if bucket_no_upscale is not None:
-            payload["bucket_no_upscale"] = bucket_no_upscale
-        if resize_interpolation is not None:
-            payload["resize_interpolation"] = resize_interpolation
+        optional_fields = {
+            "blocks_to_swap": blocks_to_swap,
+            "pretrained_path": pretrained_path or None,
+            "lr_scheduler": lr_scheduler,
+            "lr_warmup_steps": lr_warmup_steps,
+            "noise_offset": noise_offset,
+            "flip_aug": flip_aug,
+            "network_dropout": network_dropout,
+            # Bucketing
+            "enable_bucket": enable_bucket,
+            "min_bucket_reso": min_bucket_reso,
+            "max_bucket_reso": max_bucket_reso,
+            "bucket_reso_steps": bucket_reso_steps,
+            "bucket_no_upscale": bucket_no_upscale,
+            "resize_interpolation": resize_interpolation,
+            "sample_sampler": sample_sampler,
+        }
+        payload.update({k: v for k, v in optional_fields.items() if v is not None})
         # Normalize VRAM alias
         if isinstance(payload.get("vram"), str):
             vr = str(payload["vram"]).upper().replace("B", "")
@@ -3208,10 +3077,8 @@ async def api_train_prepare_upload(
                     f.write(sample_prompts or '')
         except Exception:
             pass
-        if sample_sampler is not None:
-            payload["sample_sampler"] = sample_sampler
         # Inject prompts path override via advanced flag in prepare path
-        res = api_train_prepare({ **payload, "_sample_prompts_path": sp_path })
+        res = await api_train_prepare({ **payload, "_sample_prompts_path": sp_path })
         return res
     except Exception as e:
         import traceback
@@ -3220,12 +3087,148 @@ async def api_train_prepare_upload(
         return JSONResponse({"ok": False, "error": str(e), "trace": tb}, status_code=500)
 
 
-def _stream_process(proc: subprocess.Popen, run_id: str):
+async def _iter_process_lines(stream: asyncio.StreamReader):
+    """Yield decoded lines from a subprocess pipe.
+    Mirrors text-mode Popen: carriage-return progress updates count as line breaks.
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(errors="ignore"), translate=True)
+    pending = ""
+    while True:
+        chunk = await stream.read(65536)
+        pending += decoder.decode(chunk, final=not chunk)
+        if "\n" in pending:
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                yield line + "\n"
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+def _append_run_log(run_id: str, line: str):
+    buf: bytearray = RUNS[run_id]["logs"]
+    buf += line.encode("utf-8")
+    if len(buf) > RUN_LOG_MAX_BYTES:
+        # bytearray drops a prefix in place without reallocating
+        del buf[:len(buf) - RUN_LOG_MAX_BYTES]
+
+
+class _PopenProcess:
+    """subprocess.Popen exposing the parts of asyncio.subprocess.Process the run code uses.
+    A thread pumps the pipe into an asyncio.StreamReader, so _iter_process_lines works unchanged.
+    """
+
+    def __init__(self, cmd: List[str], env_vars: Dict[str, str]):
+        self._popen = subprocess.Popen(
+            cmd,
+            cwd=str(ROOT),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env_vars,
+            start_new_session=True,
+        )
+        self.pid = self._popen.pid
+        self.stdout = asyncio.StreamReader()
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._pump, args=(loop,), daemon=True).start()
+
+    def _pump(self, loop: asyncio.AbstractEventLoop):
+        pipe = self._popen.stdout
+        try:
+            while True:
+                chunk = pipe.read1(65536)
+                if not chunk:
+                    break
+                loop.call_soon_threadsafe(self.stdout.feed_data, chunk)
+        except Exception:
+            pass
+        finally:
+            try:
+                loop.call_soon_threadsafe(self.stdout.feed_eof)
+            except RuntimeError:
+                pass  # loop already closed
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._popen.returncode
+
+    def terminate(self):
+        self._popen.terminate()
+
+    def kill(self):
+        self._popen.kill()
+
+    async def wait(self) -> int:
+        return await asyncio.to_thread(self._popen.wait)
+
+
+async def _spawn_process(cmd: List[str], env_vars: Dict[str, str]):
+    """Start cmd in ROOT with stdout+stderr piped and its own process group.
+    Windows selector loops (e.g. uvicorn --reload) have no subprocess support; those
+    get a Popen with a reader thread instead.
+    """
+    try:
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(ROOT),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env_vars,
+            start_new_session=True,
+        )
+    except NotImplementedError:
+        return _PopenProcess(cmd, env_vars)
+
+
+def _terminate_process_group(proc, force: bool = False):
+    if os.name != "nt":
+        os.killpg(os.getpgid(proc.pid), signal.SIGKILL if force else signal.SIGTERM)
+    elif force:
+        proc.kill()
+    else:
+        proc.terminate()
+
+
+def _kill_if_running(proc):
+    if proc.returncode is None:
+        try:
+            _terminate_process_group(proc, force=True)
+        except Exception:
+            pass
+
+
+async def _metric_writer(run_id: str, queue: asyncio.Queue):
+    """Write queued metric records off the event loop until a None arrives.
+    Records queued while a write is in flight go out together in the next one.
+    """
+    sinks: Dict[str, Any] = {}
+    try:
+        done = False
+        while not done:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if batch:
+                try:
+                    await asyncio.to_thread(_write_metric_records, run_id, batch, sinks)
+                except Exception:
+                    pass
+    finally:
+        _close_metric_sinks(sinks)
+
+
+async def _stream_process_async(proc, run_id: str):
+    metric_queue: asyncio.Queue = asyncio.Queue()
+    metric_writer = asyncio.create_task(_metric_writer(run_id, metric_queue))
     try:
         # Support optional TE warmup two-phase switch
         warmup_steps = RUNS.get(run_id, {}).get("te_warmup_steps")
         phase = RUNS.get(run_id, {}).get("te_phase", None)
-        def _launch_phase2():
+        async def _launch_phase2():
             sh2 = RUNS.get(run_id, {}).get("phase2_sh_path")
             if not sh2:
                 return None
@@ -3233,68 +3236,57 @@ def _stream_process(proc: subprocess.Popen, run_id: str):
             env_vars["PYTHONIOENCODING"] = "utf-8"
             env_vars["LOG_LEVEL"] = "DEBUG"
             env_vars.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
-            cmd2 = sh2 if os.name == "nt" else f'bash "{sh2}"'
-            p2 = subprocess.Popen(
-                cmd2,
-                cwd=str(ROOT),
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                env=env_vars,
-                bufsize=1,
-                text=True,
-                encoding="utf-8",
-                errors="ignore",
-                start_new_session=True,
-            )
+            cmd2 = [sh2] if os.name == "nt" else ["bash", sh2]
+            p2 = await _spawn_process(cmd2, env_vars)
             RUNS[run_id]["proc"] = p2
             RUNS[run_id]["te_phase"] = 2
             return p2
 
         current_proc = proc
-        cur_step = 0
         while True:
-            for line in iter(current_proc.stdout.readline, ""):
-                RUNS[run_id]["logs"].append(line)
-                try:
-                    _maybe_parse_and_log_metric_line(run_id, line)
-                except Exception:
-                    pass
-                # parse step for warmup switch
-                m = _RE_PROGRESS.search(line)
-                if m:
-                    try:
-                        cur_step = int(m.group("cur"))
-                    except Exception:
-                        pass
-                if warmup_steps and phase == 1 and cur_step >= warmup_steps:
+            switching = False
+            async for line in _iter_process_lines(current_proc.stdout):
+                _append_run_log(run_id, line)
+                rec = _parse_metric_line(line)
+                if rec is None:
+                    continue
+                metric_queue.put_nowait(rec)
+                if not switching and warmup_steps and phase == 1 and rec["step"] >= warmup_steps:
+                    # stop phase 1, then keep draining its pipe until it has exited
                     try:
-                        # stop phase 1
-                        if os.name != "nt":
-                            import signal
-                            os.killpg(os.getpgid(current_proc.pid), signal.SIGTERM)
-                        else:
-                            current_proc.terminate()
+                        _terminate_process_group(current_proc)
                     except Exception:
                         pass
-                    # launch phase 2
-                    nxt = _launch_phase2()
-                    if nxt is None:
-                        break
+                    kill_timer = asyncio.get_running_loop().call_later(
+                        PHASE1_STOP_TIMEOUT, _kill_if_running, current_proc
+                    )
+                    switching = True
+            code = await current_proc.wait()
+            if switching:
+                kill_timer.cancel()
+            # Don't start phase 2 if the user stopped the run during the switch
+            if switching and RUNS[run_id].get("status") != "stopping":
+                # launched only once phase 1 is gone, so its VRAM is free again
+                nxt = await _launch_phase2()
+                if nxt is not None:
                     current_proc = nxt
                     warmup_steps = None  # avoid re-trigger
                     phase = 2
-                    break
-            current_proc.wait()
-            code = current_proc.returncode
+                    continue
             RUNS[run_id]["status"] = "finished" if code == 0 else f"error:{code}"
             break
     except Exception as e:
         RUNS[run_id]["status"] = f"error:{e}"
+    finally:
+        metric_queue.put_nowait(None)
+        try:
+            await metric_writer
+        except Exception:
+            pass
 
 
 @app.post("/api/train/start")
-def api_train_start(payload: Dict[str, Any]):
+async def api_train_start(payload: Dict[str, Any]):
     run_id = payload.get("run_id")
     run = RUNS.get(run_id)
     if not run:
@@ -3305,11 +3297,12 @@ def api_train_start(payload: Dict[str, Any]):
         if not run.get("pretrained_path") and tu_download and tu_load_models_yaml and isinstance(run.get("base_model"), str):
             models = tu_load_models_yaml()
             if run["base_model"] in models:
-                tu_download(run["base_model"])
+                await asyncio.to_thread(tu_download, run["base_model"])
     except Exception as e:
         return {"ok": False, "message": f"download failed: {e}"}
     sh_path = run["sh_path"]
-    cmd = sh_path if os.name == "nt" else f'bash "{sh_path}"'
+    # argv form: no intermediate /bin/sh and no quoting issues in output names
+    cmd = [sh_path] if os.name == "nt" else ["bash", sh_path]
     # Ensure our virtualenv bin is on PATH so 'accelerate' is found
     env_vars = dict(os.environ)
     env_vars["PYTHONIOENCODING"] = "utf-8"
@@ -3329,41 +3322,27 @@ def api_train_start(payload: Dict[str, Any]):
     env_vars["PATH"] = os.pathsep.join(path_parts)
 
     # Start process with a new session so we can terminate group on stop
-    proc = subprocess.Popen(
-        cmd,
-        cwd=str(ROOT),
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        env=env_vars,
-        bufsize=1,
-        text=True,
-        encoding="utf-8",
-        errors="ignore",
-        start_new_session=True,
-    )
+    proc = await _spawn_process(cmd, env_vars)
     run["status"] = "running"
     run["started_at"] = time.time()
     run["proc"] = proc
-    threading.Thread(target=_stream_process, args=(proc, run_id), daemon=True).start()
+    # Output of every run is pumped by the event loop; keep a reference so the task is not collected
+    run["task"] = asyncio.create_task(_stream_process_async(proc, run_id))
     return {"ok": True, "run_id": run_id}
 
 
 @app.post("/api/train/stop")
-def api_train_stop(payload: Dict[str, Any]):
+async def api_train_stop(payload: Dict[str, Any]):
+    # async: the process object belongs to the event loop, so signal it from the loop
     run_id = payload.get("run_id")
     run = RUNS.get(run_id)
     if not run:
         return JSONResponse({"ok": False, "message": "invalid run_id"}, status_code=400)
-    proc: subprocess.Popen = run.get("proc")  # type: ignore
+    proc = run.get("proc")
     if not proc:
         return {"ok": False, "message": "no process"}
     try:
-        if os.name != "nt":
-            import signal
-            os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-        else:
-            proc.terminate()
+        _terminate_process_group(proc)
         run["status"] = "stopping"
         return {"ok": True}
     except Exception as e:
@@ -3378,7 +3357,7 @@ def api_train_logs(run_id: str):
     return {
         "ok": True,
         "status": run.get("status"),
-        "logs": "".join(run.get("logs", []))[-20000:],
+        "logs": run.get("logs", bytearray())[-20000:].decode("utf-8", "ignore"),
     }
 
 
@@ -3387,7 +3366,7 @@ def api_train_logs_download(run_id: str):
     run = RUNS.get(run_id)
     if not run:
         return JSONResponse({"ok": False, "message": "invalid run_id"}, status_code=400)
-    text = "".join(run.get("logs", []))
+    text = run.get("logs", bytearray()).decode("utf-8", "ignore")
     from fastapi.responses import PlainTextResponse
     headers = {"Content-Disposition": f'attachment; filename="train_{run_id}.log"'}
     return PlainTextResponse(text, headers=headers)
@@ -3411,45 +3390,75 @@ def api_train_active():
 _RE_PROGRESS = re.compile(r"(?P<cur>\d+)\s*/\s*(?P<total>\d+).+?avr_loss=(?P<loss>[0-9]*\.?[0-9]+)")
 
 
-def _maybe_parse_and_log_metric_line(run_id: str, line: str):
-    info = RUNS.get(run_id) or {}
-    out_name = info.get("output_name")
-    if not out_name:
-        return
+def _parse_metric_line(line: str) -> Optional[Dict[str, Any]]:
+    """Metric record for a trainer progress line, or None"""
     m = _RE_PROGRESS.search(line)
     if not m:
-        return
+        return None
     try:
-        step = int(m.group("cur"))
-        total = int(m.group("total"))
-        avr_loss = float(m.group("loss"))
+        return {
+            "step": int(m.group("cur")),
+            "total": int(m.group("total")),
+            "avr_loss": float(m.group("loss")),
+            "ts": _time_for_metrics.time(),
+        }
     except Exception:
-        return
+        return None
 
-    csv_path, jsonl_path = _metrics_paths_for_output(out_name)
-    rec = {
-        "step": step,
-        "total": total,
-        "avr_loss": avr_loss,
-        "ts": _time_for_metrics.time(),
-    }
+
+def _write_metric_records(run_id: str, records: List[Dict[str, Any]], sinks: Dict[str, Any]):
+    """Append records to the run's JSONL/CSV files; runs in a worker thread.
+
+    ``sinks`` holds the file handles for the run; they are opened on the first
+    batch and kept open until _close_metric_sinks.
+    """
+    out_name = (RUNS.get(run_id) or {}).get("output_name")
+    if not out_name:
+        return
+    if not sinks:
+        csv_path, jsonl_path = _metrics_paths_for_output(out_name)
+        try:
+            os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+            sinks["jsonl"] = open(jsonl_path, "a", encoding="utf-8")
+        except Exception:
+            sinks["jsonl"] = None
+        try:
+            cf = open(csv_path, "a", newline="")
+            sinks["csv_file"] = cf
+            sinks["csv"] = csv.DictWriter(cf, fieldnames=list(records[0].keys()))
+            # append mode starts at the end, so an empty file still needs its header
+            if cf.tell() == 0:
+                sinks["csv"].writeheader()
+        except Exception:
+            sinks["csv_file"] = sinks["csv"] = None
     # write jsonl
-    try:
-        os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
-        with open(jsonl_path, "a", encoding="utf-8") as jf:
-            jf.write(json.dumps(rec, ensure_ascii=False) + "\n")
-    except Exception:
-        pass
-    # write/update csv with header
-    try:
-        need_header = not os.path.exists(csv_path)
-        with open(csv_path, "a", newline="") as f:
-            w = csv.DictWriter(f, fieldnames=list(rec.keys()))
-            if need_header:
-                w.writeheader()
-            w.writerow(rec)
-    except Exception:
-        pass
+    jf = sinks.get("jsonl")
+    if jf is not None:
+        try:
+            jf.write("".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records))
+            # flushed per batch so the metrics endpoints see it while the run is live
+            jf.flush()
+        except Exception:
+            pass
+    # write csv
+    w = sinks.get("csv")
+    if w is not None:
+        try:
+            w.writerows(records)
+            sinks["csv_file"].flush()
+        except Exception:
+            pass
+
+
+def _close_metric_sinks(sinks: Dict[str, Any]):
+    for key in ("jsonl", "csv_file"):
+        f = sinks.get(key)
+        if f is not None:
+            try:
+                f.close()
+            except Exception:
+                pass
+    sinks.clear()
 
 if __name__ == "__main__":
     import uvicorn
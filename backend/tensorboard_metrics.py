@@ -1,18 +1,227 @@
 #!/usr/bin/env python3
 """Enhanced TensorBoard metrics handler for training monitoring"""
 
+import asyncio
 import os
 import json
+import struct
 import time
 import logging
 from pathlib import Path
-from typing import Optional, Dict, List, Any, Generator, Tuple
+from typing import Optional, Dict, List, Any, AsyncGenerator, Tuple, Callable
 from dataclasses import dataclass, asdict
 import threading
-from collections import deque
+from collections import OrderedDict
+from operator import itemgetter
+from bisect import bisect_left
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson  # optional, faster serialization
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+
+def _sse_frame(obj: Any) -> bytes:
+    """Encode obj as a complete SSE data frame"""
+    return b"data: " + _dumps(obj) + b"\n\n"
+
+
+# Heartbeat frame is constant, serialize it once
+_HB = _sse_frame({'heartbeat': True})
+
+
+def _crc32c_table() -> List[int]:
+    """Lookup table for the reflected CRC32C (Castagnoli) polynomial"""
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+def _crc32c_loop(crc, buf, table):
+    """Table-driven CRC32C update, compiled with numba when it is installed"""
+    crc ^= 0xFFFFFFFF
+    for b in buf:
+        crc = (table[(crc ^ b) & 0xFF] ^ (crc >> 8)) & 0xFFFFFFFF
+    return crc ^ 0xFFFFFFFF
+
+
+def _fast_crc_update():
+    """Best available CRC32C update: google-crc32c (hardware), then numba"""
+    try:
+        import google_crc32c  # optional, SSE4.2 / ARMv8 CRC32C
+        if google_crc32c.implementation == "c":
+            extend = google_crc32c.extend
+            
+            def crc_update(crc, data):
+                return extend(crc, data if type(data) is bytes else bytes(data))
+            return crc_update, "google-crc32c"
+    except Exception:
+        pass
+        
+    try:
+        import numpy as np  # optional
+        from numba import njit  # optional
+        table = np.array(_crc32c_table(), dtype=np.uint32)
+        crc_loop = njit(cache=True)(_crc32c_loop)
+        
+        def crc_update(crc, data):
+            buf = np.frombuffer(data, dtype=np.uint8)
+            return int(crc_loop(int(crc), buf, table))
+        return crc_update, "numba"
+    except Exception:
+        return None, None
+
+
+_MASKED_CRC = None
+_MASKED_CRC_FAST = False
+_MASKED_CRC_RESOLVED = False
+
+# Without a compiled CRC32C backend, payloads above this size are not verified;
+# the pure-Python loop would take seconds on image summaries
+_PY_CRC_MAX_PAYLOAD = 64 * 1024
+
+
+def _masked_crc32c_fn() -> Tuple[Callable[[bytes], int], bool]:
+    """Masked CRC32C function for record checks, and whether it is a compiled backend"""
+    global _MASKED_CRC, _MASKED_CRC_FAST, _MASKED_CRC_RESOLVED
+    if _MASKED_CRC_RESOLVED:
+        return _MASKED_CRC, _MASKED_CRC_FAST
+    
+    try:
+        crc_update, backend = _fast_crc_update()
+        # Standard CRC32C check value
+        if crc_update is not None and crc_update(0, b"123456789") != 0xE3069283:
+            crc_update = None
+    except Exception as e:
+        logger.debug(f"CRC32C backend unavailable: {e}")
+        crc_update = None
+        
+    if crc_update is None:
+        table = _crc32c_table()
+        
+        def crc_update(crc, data):
+            return _crc32c_loop(crc, data, table)
+        backend = "pure-Python"
+        logger.info(
+            "google-crc32c not available; verifying TensorBoard records with a pure-Python "
+            f"CRC32C (payloads over {_PY_CRC_MAX_PAYLOAD // 1024} KiB are not verified)"
+        )
+        
+    def masked_crc32c(data) -> int:
+        crc = crc_update(0, data)
+        return (((crc >> 15) | ((crc << 17) & 0xFFFFFFFF)) + 0xA282EAD8) & 0xFFFFFFFF
+    
+    _MASKED_CRC = masked_crc32c
+    _MASKED_CRC_FAST = backend != "pure-Python"
+    _MASKED_CRC_RESOLVED = True
+    logger.debug(f"Verifying TensorBoard records with {backend} CRC32C")
+    return _MASKED_CRC, _MASKED_CRC_FAST
+
+
+# tfrecord framing: uint64 length, masked CRC of the length, payload, masked CRC of the payload
+_RECORD_HEADER = struct.Struct('<QI')
+_RECORD_FOOTER = struct.Struct('<I')
+_READ_CHUNK = 1 << 20  # event files are read in 1 MiB chunks (or one record, if larger)
+
+
+def _read_scalar_events(path: str, offset: int) -> Tuple[List[Tuple[str, int, float, float]], int, bool]:
+    """Read (tag, step, wall_time, value) scalars from an event file starting at offset.
+    
+    Returns the scalars, the offset after the last complete record, and whether
+    the framing is intact. A record that is still being written is left for the
+    next call; a record whose payload fails its checksum is skipped. A corrupt
+    length header means the record boundaries are lost, so reading stops there
+    and False is returned.
+    """
+    from tensorboard.compat.proto import event_pb2
+    
+    parse = event_pb2.Event.FromString
+    masked_crc, fast_crc = _masked_crc32c_fn()
+    header_size = _RECORD_HEADER.size
+    footer_size = _RECORD_FOOTER.size
+    
+    scalars = []
+    intact = True
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buf = b''
+        pos = 0  # start of the next record in buf; buf[0] is at file offset `offset`
+        while True:
+            avail = len(buf) - pos
+            need = header_size
+            if avail >= header_size:
+                length, length_crc = _RECORD_HEADER.unpack_from(buf, pos)
+                if masked_crc(buf[pos:pos + 8]) != length_crc:
+                    logger.warning(f"Corrupt record header in {path} at offset {offset + pos}; skipping the rest of the file")
+                    intact = False
+                    break
+                need = header_size + length + footer_size
+                if avail >= need:
+                    start = pos + header_size
+                    stop = start + length
+                    payload = buf[start:stop]
+                    pos += need
+                    
+                    if (fast_crc or length <= _PY_CRC_MAX_PAYLOAD) and (
+                        masked_crc(payload) != _RECORD_FOOTER.unpack_from(buf, stop)[0]
+                    ):
+                        logger.warning(f"Skipping record with a bad checksum in {path} at offset {offset + start - header_size}")
+                        continue
+                    try:
+                        event = parse(payload)
+                    except Exception:
+                        logger.warning(f"Skipping unparsable record in {path} at offset {offset + start - header_size}")
+                        continue
+                    if event.HasField('summary'):
+                        step = event.step
+                        wall_time = event.wall_time
+                        for value in event.summary.value:
+                            if value.HasField('simple_value'):
+                                scalars.append((value.tag, step, wall_time, value.simple_value))
+                    continue
+                    
+            # Not enough buffered for the next header or record: read on from the file
+            chunk = f.read(max(_READ_CHUNK, need - avail))
+            if not chunk:
+                break
+            offset += pos
+            buf = buf[pos:] + chunk
+            pos = 0
+            
+    return scalars, offset + pos, intact
+
+
+def _row_to_point(row: list) -> Dict[str, Any]:
+    """Metric dict for a [step, ts, loss, lr, grad_norm] row, without missing fields"""
+    step, ts, loss, lr, grad_norm = row
+    point = {'step': step}
+    if ts is not None:
+        point['ts'] = ts
+    if loss is not None:
+        point['loss'] = loss
+    if lr is not None:
+        point['lr'] = lr
+    if grad_norm is not None:
+        point['grad_norm'] = grad_norm
+    return point
+
+
+def _safe_float(value: str) -> Optional[float]:
+    """float() that returns None for unparsable values"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
 @dataclass
 class MetricPoint:
     """Single metric point with all possible fields"""
@@ -58,140 +267,345 @@ class TensorBoardMetricsReader:
         'gradients/norm'
     ]
     
+    # Precomputed lookups for _find_best_tag: exact tag sets and the
+    # de-duplicated last path segments used by the fuzzy fallback
+    _LOSS_SET = frozenset(LOSS_TAGS)
+    _LR_SET = frozenset(LR_TAGS)
+    _GRAD_NORM_SET = frozenset(GRAD_NORM_TAGS)
+    _LOSS_SUFFIXES = tuple(dict.fromkeys(p.rsplit('/', 1)[-1] for p in LOSS_TAGS))
+    _LR_SUFFIXES = tuple(dict.fromkeys(p.rsplit('/', 1)[-1] for p in LR_TAGS))
+    _GRAD_NORM_SUFFIXES = tuple(dict.fromkeys(p.rsplit('/', 1)[-1] for p in GRAD_NORM_TAGS))
+    
     def __init__(self, tb_dir: str, cache_size: int = 1000):
         self.tb_dir = Path(tb_dir)
         self.cache_size = cache_size
-        self._cache: deque = deque(maxlen=cache_size)
-        self._last_reload = 0
+        self._cache: List[Dict] = []  # one point dict per row in _ordered
         self._reload_interval = 2.0  # seconds
-        self._ea = None
         self._lock = threading.Lock()
+        self._event_dir_cache: Optional[Path] = None
+        self._event_dir_mtime: float = 0
+        # Incremental read state, reset whenever the event directory changes
+        self._event_dir: Optional[Path] = None
+        self._offsets: Dict[str, int] = {}  # event file -> bytes consumed
+        self._broken: set = set()  # event files past a corrupt record header
+        self._tags: Dict[str, None] = {}  # scalar tags in first-seen order
+        self._selected: Optional[Tuple[str, Optional[str], Optional[str]]] = None
+        self._points: Dict[int, list] = {}  # step -> [step, ts, loss, lr, grad_norm]
+        self._ordered: List[list] = []  # rows sorted by step, aligned with _cache
+        # Past _max_points rows the history is thinned to steps divisible by
+        # _stride (doubled each time), so the whole run stays covered evenly;
+        # the newest row is always kept
+        self._max_points = 10000
+        self._stride = 1
+        self._resync = False
+        # Immutable (metrics, source) snapshot published by the refresher thread;
+        # _lock is only taken by the writer side
+        self._snapshot: Optional[Tuple[tuple, str]] = None
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._closed = False
+        self._last_read: float = 0
+        self._idle_timeout = 60.0  # seconds without readers before the refresher exits
         
     def _find_event_dir(self) -> Optional[Path]:
         """Find the most recent TensorBoard event directory"""
-        if not self.tb_dir.exists():
+        try:
+            tb_mtime = self.tb_dir.stat().st_mtime
+        except OSError:
             return None
             
-        # Look for event files
-        event_files = []
-        for root, _, files in os.walk(self.tb_dir):
-            for file in files:
-                if file.startswith("events.out.tfevents"):
-                    full_path = Path(root) / file
-                    event_files.append((full_path.stat().st_mtime, Path(root)))
+        # A new run shows up as a new child of tb_dir, so its mtime guards the cache
+        cached = self._event_dir_cache
+        if cached is not None and tb_mtime == self._event_dir_mtime and cached.is_dir():
+            return cached
+            
+        # Look for event files, keeping only the newest (mtime, directory) pair
+        best_mtime = -1.0
+        best_dir = None
+        pending = [str(self.tb_dir)]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.startswith("events.out.tfevents"):
+                            mtime = entry.stat().st_mtime
+                            if mtime > best_mtime:
+                                best_mtime, best_dir = mtime, current
+            except OSError:
+                continue
                     
-        if not event_files:
+        if best_dir is None:
             return None
             
-        # Return directory with most recent event file
-        event_files.sort(reverse=True)
-        return event_files[0][1]
+        self._event_dir_cache = Path(best_dir)
+        # Only trust the cache once tb_dir has settled; a run directory created
+        # moments ago may not contain its event file yet
+        self._event_dir_mtime = tb_mtime if time.time() - tb_mtime > 5.0 else 0
+        return self._event_dir_cache
     
-    def _get_accumulator(self):
-        """Get or create EventAccumulator with lazy loading"""
+    def _read_new_scalars(self) -> Optional[List[Tuple[str, int, float, float]]]:
+        """Read scalars appended to the current run's event files since the last call"""
         try:
-            from tensorboard.backend.event_processing import event_accumulator
+            from tensorboard.compat.proto import event_pb2  # noqa: F401
         except ImportError:
             logger.warning("TensorBoard not installed")
             return None
             
-        if self._ea is None or time.time() - self._last_reload > self._reload_interval:
-            event_dir = self._find_event_dir()
-            if not event_dir:
-                return None
-                
-            try:
-                self._ea = event_accumulator.EventAccumulator(str(event_dir))
-                self._ea.Reload()
-                self._last_reload = time.time()
-            except Exception as e:
-                logger.error(f"Failed to load TensorBoard events: {e}")
-                return None
+        event_dir = self._find_event_dir()
+        if not event_dir:
+            return None
+            
+        if event_dir != self._event_dir:
+            # New run directory: start over
+            self._event_dir = event_dir
+            self._offsets = {}
+            self._broken = set()
+            self._tags = {}
+            self._selected = None
+            self._points = {}
+            self._ordered = []
+            self._cache = []
+            self._stride = 1
+            
+        try:
+            with os.scandir(event_dir) as it:
+                files = sorted(
+                    (entry.path, entry.stat().st_size)
+                    for entry in it
+                    if entry.name.startswith("events.out.tfevents") and entry.is_file()
+                )
                 
-        return self._ea
+            scalars = []
+            # Offsets are committed only once every file was read; if one fails, the
+            # next refresh re-reads the others instead of skipping what was dropped
+            offsets = dict(self._offsets)
+            broken = set(self._broken)
+            for path, size in files:
+                offset = offsets.get(path, 0)
+                if size == offset:
+                    continue
+                if size < offset:
+                    offset = 0  # file was rewritten
+                    broken.discard(path)
+                elif path in broken:
+                    continue  # framing lost, already reported
+                new, offsets[path], intact = _read_scalar_events(path, offset)
+                if not intact:
+                    broken.add(path)
+                scalars.extend(new)
+            self._offsets = offsets
+            self._broken = broken
+            return scalars
+        except Exception as e:
+            logger.error(f"Failed to load TensorBoard events: {e}")
+            return None
     
-    def _find_best_tag(self, tags: List[str], patterns: List[str]) -> Optional[str]:
+    def _find_best_tag(
+        self,
+        tags: List[str],
+        tag_set: frozenset,
+        exact_set: frozenset,
+        patterns: List[str],
+        suffixes: Tuple[str, ...],
+    ) -> Optional[str]:
         """Find the best matching tag from patterns"""
-        for pattern in patterns:
-            if pattern in tags:
-                return pattern
+        if not exact_set.isdisjoint(tag_set):
+            for pattern in patterns:
+                if pattern in tag_set:
+                    return pattern
         
         # Fallback: find any tag containing key words
         for tag in tags:
             tag_lower = tag.lower()
-            for pattern in patterns:
-                if pattern.split('/')[-1] in tag_lower:
+            for suffix in suffixes:
+                if suffix in tag_lower:
                     return tag
         
         return None
     
-    def get_recent_metrics(self, limit: int = 512) -> Tuple[List[Dict], str]:
-        """Get recent metrics from TensorBoard"""
-        with self._lock:
-            ea = self._get_accumulator()
-            if not ea:
-                return [], "none"
-                
-            try:
-                tags = ea.Tags().get('scalars', [])
-                if not tags:
-                    return [], "tensorboard"
-                    
-                # Find best tags for each metric type
-                loss_tag = self._find_best_tag(tags, self.LOSS_TAGS)
-                lr_tag = self._find_best_tag(tags, self.LR_TAGS)
-                grad_norm_tag = self._find_best_tag(tags, self.GRAD_NORM_TAGS)
-                
-                if not loss_tag:
-                    logger.warning(f"No loss tag found in: {tags}")
-                    return [], "tensorboard"
-                
-                # Collect all events
-                events_by_step = {}
-                
-                # Get loss events
-                for event in ea.Scalars(loss_tag):
-                    step = event.step
-                    if step not in events_by_step:
-                        events_by_step[step] = MetricPoint()
-                    events_by_step[step].step = step
-                    events_by_step[step].ts = event.wall_time
-                    events_by_step[step].loss = event.value
-                
-                # Get LR events if available
-                if lr_tag:
-                    for event in ea.Scalars(lr_tag):
-                        step = event.step
-                        if step not in events_by_step:
-                            events_by_step[step] = MetricPoint()
-                        events_by_step[step].lr = event.value
-                
-                # Get gradient norm if available
-                if grad_norm_tag:
-                    for event in ea.Scalars(grad_norm_tag):
-                        step = event.step
-                        if step in events_by_step:
-                            events_by_step[step].grad_norm = event.value
-                
-                # Convert to list and sort by step
-                metrics = [point.to_dict() for point in events_by_step.values()]
-                metrics.sort(key=lambda x: x.get('step', 0))
-                
-                # Apply limit
-                if limit > 0:
-                    metrics = metrics[-limit:]
-                
-                # Update cache
-                self._cache.clear()
-                self._cache.extend(metrics)
+    def _thin(self, ordered: List[list], stride: int) -> List[list]:
+        """Rows of ordered on the stride plus the newest one; drops the rest from _points"""
+        if stride == 1 or not ordered:
+            return ordered
+        kept = []
+        for row in ordered[:-1]:
+            if row[0] % stride:
+                del self._points[row[0]]
+            else:
+                kept.append(row)
+        kept.append(ordered[-1])
+        return kept
+    
+    def _read_metrics(self) -> Tuple[tuple, str]:
+        """Read all merged metrics from TensorBoard; only called by the single writer"""
+        scalars = self._read_new_scalars()
+        if scalars is None:
+            return (), "none"
+            
+        try:
+            for scalar in scalars:
+                if scalar[0] not in self._tags:
+                    self._tags[scalar[0]] = None
+            tags = list(self._tags)
+            if not tags:
+                return (), "tensorboard"
                 
-                return metrics, "tensorboard"
+            # Find best tags for each metric type
+            tag_set = frozenset(tags)
+            loss_tag = self._find_best_tag(tags, tag_set, self._LOSS_SET, self.LOSS_TAGS, self._LOSS_SUFFIXES)
+            lr_tag = self._find_best_tag(tags, tag_set, self._LR_SET, self.LR_TAGS, self._LR_SUFFIXES)
+            grad_norm_tag = self._find_best_tag(
+                tags, tag_set, self._GRAD_NORM_SET, self.GRAD_NORM_TAGS, self._GRAD_NORM_SUFFIXES
+            )
+            
+            if not loss_tag:
+                logger.warning(f"No loss tag found in: {tags}")
+                return (), "tensorboard"
                 
+            selected = (loss_tag, lr_tag, grad_norm_tag)
+            if selected != self._selected:
+                if self._selected is not None:
+                    # A better matching tag showed up: rebuild the rows from the start
+                    self._offsets = {}
+                    self._broken = set()
+                    self._points = {}
+                    self._ordered = []
+                    self._cache = []
+                    self._stride = 1
+                    scalars = self._read_new_scalars() or []
+                self._selected = selected
+            
+            # Merge the new scalars into the persistent rows
+            rows = self._points
+            created = []
+            touched = set()
+            grad_norms = []
+            for tag, step, wall_time, value in scalars:
+                if tag == loss_tag:
+                    row = rows.get(step)
+                    if row is None:
+                        row = rows[step] = [step, None, None, None, None]
+                        created.append(row)
+                    else:
+                        touched.add(step)
+                    row[1] = wall_time
+                    row[2] = value
+                elif tag == lr_tag:
+                    row = rows.get(step)
+                    if row is None:
+                        row = rows[step] = [step, None, None, None, None]
+                        created.append(row)
+                    else:
+                        touched.add(step)
+                    row[3] = value
+                elif tag == grad_norm_tag:
+                    grad_norms.append((step, value))
+                    
+            # Gradient norm only annotates steps that already have a row
+            for step, value in grad_norms:
+                row = rows.get(step)
+                if row is not None:
+                    row[4] = value
+                    touched.add(step)
+            
+            ordered = self._ordered
+            metrics = self._cache
+            stride = self._stride
+            if created:
+                created.sort(key=itemgetter(0))
+                created = self._thin(created, stride)
+            if self._resync or (created and ordered and created[0][0] <= ordered[-1][0]):
+                # Out-of-order steps (rare) or a failed merge: re-sort and rebuild every point
+                ordered[:] = self._thin(sorted(rows.values(), key=itemgetter(0)), stride)
+                metrics[:] = map(_row_to_point, ordered)
+                self._resync = False
+            else:
+                # Usual case: steps only grow, so append the new rows and
+                # rebuild just the points of rows that gained a value
+                if created and ordered and ordered[-1][0] % stride:
+                    # The previous newest row was only kept for being the newest
+                    del rows[ordered.pop()[0]]
+                    metrics.pop()
+                ordered.extend(created)
+                metrics.extend(map(_row_to_point, created))
+                for step in touched.difference(row[0] for row in created):
+                    if step in rows:
+                        i = bisect_left(ordered, step, key=itemgetter(0))
+                        metrics[i] = _row_to_point(ordered[i])
+            
+            # Too many rows: double the stride until the thinned history fits
+            if len(ordered) > self._max_points:
+                while len(ordered) > self._max_points:
+                    stride *= 2
+                    ordered[:] = self._thin(ordered, stride)
+                metrics[:] = map(_row_to_point, ordered)
+                self._stride = stride
+            
+            # Nothing new since the last refresh: keep publishing the same snapshot
+            snapshot = self._snapshot
+            if not created and not touched and snapshot is not None and snapshot[1] == "tensorboard":
+                return snapshot
+            
+            # Points are never mutated once built; the tuple copy is bounded by _max_points
+            return tuple(metrics), "tensorboard"
+            
+        except Exception as e:
+            logger.error(f"Error reading TensorBoard metrics: {e}")
+            # The merge may have stopped half way; realign _ordered and _cache next time
+            self._resync = True
+            return tuple(self._cache[-self.cache_size:]), "tensorboard"
+    
+    def _refresh(self) -> None:
+        """Publish a fresh snapshot"""
+        with self._lock:
+            self._snapshot = self._read_metrics()
+    
+    def _refresh_loop(self) -> None:
+        """Refresh the snapshot every reload interval until closed or idle"""
+        while not self._stop.wait(self._reload_interval):
+            if self._closed or time.time() - self._last_read > self._idle_timeout:
+                break
+            try:
+                self._refresh()
             except Exception as e:
-                logger.error(f"Error reading TensorBoard metrics: {e}")
-                return list(self._cache)[-limit:] if self._cache else [], "tensorboard"
+                logger.error(f"TensorBoard refresher error: {e}")
+    
+    def _ensure_refresher(self) -> None:
+        """Start the refresher thread if it is not running"""
+        refresher = self._refresher
+        if refresher is not None and refresher.is_alive():
+            return
+        with self._lock:
+            if self._closed:
+                return
+            if self._refresher is None or not self._refresher.is_alive():
+                self._stop.clear()
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name=f"tb-metrics:{self.tb_dir}", daemon=True
+                )
+                self._refresher.start()
+    
+    def close(self) -> None:
+        """Stop the refresher thread for good; later reads serve the last snapshot"""
+        self._closed = True
+        self._stop.set()
+    
+    def get_recent_metrics(self, limit: int = 512) -> Tuple[List[Dict], str]:
+        """Get recent metrics from TensorBoard"""
+        self._last_read = time.time()
+        if self._snapshot is None:
+            # First read populates the snapshot synchronously
+            self._refresh()
+        self._ensure_refresher()
+        
+        # Readers only take a reference to the immutable snapshot, no lock needed
+        metrics, source = self._snapshot
+        return list(metrics[-limit:] if limit > 0 else metrics), source
     
-    def stream_metrics(self) -> Generator[str, None, None]:
+    async def stream_metrics(self) -> AsyncGenerator[bytes, None]:
         """Stream metrics as Server-Sent Events"""
         last_step = -1
         error_count = 0
@@ -199,89 +613,138 @@ class TensorBoardMetricsReader:
         
         while error_count < max_errors:
             try:
-                metrics, source = self.get_recent_metrics(limit=10)
+                metrics, source = await asyncio.to_thread(self.get_recent_metrics, 10)
                 
                 if metrics:
                     # Find new metrics
                     new_metrics = [m for m in metrics if m.get('step', -1) > last_step]
                     
                     for metric in new_metrics:
-                        yield f"data: {json.dumps(metric)}\n\n"
+                        yield _sse_frame(metric)
                         last_step = max(last_step, metric.get('step', -1))
                     
                     error_count = 0  # Reset on success
                 
                 # Send heartbeat
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-                time.sleep(1.0)
+                yield _HB
+                await asyncio.sleep(1.0)
                 
             except Exception as e:
                 logger.error(f"Stream error: {e}")
                 error_count += 1
-                time.sleep(2.0)
+                await asyncio.sleep(2.0)
         
         # Too many errors, notify client
-        yield f"data: {json.dumps({'error': 'Too many errors, stopping stream'})}\n\n"
+        yield _sse_frame({'error': 'Too many errors, stopping stream'})
 
 
 class CSVMetricsReader:
     """Fallback CSV metrics reader for sd-scripts output"""
     
+    # Known columns and their converters, in the order they appear in output dicts
+    _FIELDS = (
+        ('step', int),
+        ('epoch', float),
+        ('loss', float),
+        ('avr_loss', float),
+        ('lr', float),
+        ('grad_norm', _safe_float),
+    )
+    
     def __init__(self, csv_path: str):
         self.csv_path = Path(csv_path)
         self._cache = []
         self._last_mtime = 0
+        # Incremental read state: bytes consumed so far (complete lines only)
+        self._size = 0
+        self._offset = 0
+        self._inode = None
+        self._header: Optional[List[str]] = None
+        self._converters: Tuple[Tuple[int, str, Callable[[str], Any]], ...] = ()
+        # Readers are shared per output and polled from worker threads; the
+        # read/parse/commit sequence must not interleave
+        self._lock = threading.Lock()
+        
+    def _build_converters(self, header: List[str]) -> Tuple[Tuple[int, str, Callable[[str], Any]], ...]:
+        """Map the header to (column index, field, converter) in output field order"""
+        index = {name: i for i, name in enumerate(header)}
+        return tuple((index[name], name, conv) for name, conv in self._FIELDS if name in index)
         
     def get_recent_metrics(self, limit: int = 512) -> Tuple[List[Dict], str]:
-        """Read metrics from CSV file"""
+        """Read metrics from CSV file, parsing only rows appended since the last call"""
         if not self.csv_path.exists():
             return [], "none"
             
+        with self._lock:
+            metrics = self._read_new_rows()
+        # Callers get their own list; the cache keeps growing after we return
+        return list(metrics[-limit:] if limit > 0 else metrics), "csv"
+        
+    def _read_new_rows(self) -> List[Dict]:
+        """Parse rows appended since the last call into the cache; caller holds _lock"""
         try:
             import csv
             
-            # Always re-read the file to get latest data
-            metrics = []
-            with open(self.csv_path, 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    point = MetricPoint()
-                    
-                    # Parse fields
-                    if 'step' in row:
-                        point.step = int(row['step'])
-                    if 'epoch' in row:
-                        point.epoch = float(row['epoch'])
-                    if 'loss' in row:
-                        point.loss = float(row['loss'])
-                    if 'avr_loss' in row:
-                        point.avr_loss = float(row['avr_loss'])
-                    if 'lr' in row:
-                        point.lr = float(row['lr'])
-                    if 'grad_norm' in row and row['grad_norm']:
-                        try:
-                            point.grad_norm = float(row['grad_norm'])
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    metrics.append(point.to_dict())
+            st = self.csv_path.stat()
+            if st.st_mtime == self._last_mtime and st.st_size == self._size and st.st_ino == self._inode:
+                return self._cache
             
-            self._cache = metrics
-            self._last_mtime = self.csv_path.stat().st_mtime
+            # Start over if the file was truncated or replaced
+            if st.st_size < self._offset or st.st_ino != self._inode:
+                self._cache = []
+                self._offset = 0
+                self._header = None
+                self._converters = ()
             
-            return metrics[-limit:] if limit > 0 else metrics, "csv"
+            with open(self.csv_path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+            
+            # Only consume complete lines; a partially written row is re-read next time
+            end = data.rfind(b'\n') + 1
+            lines = data[:end].decode('utf-8', 'replace').splitlines()
+            
+            header = self._header
+            if header is None and lines:
+                header = next(csv.reader([lines[0]]))
+                lines = lines[1:]
+                self._converters = self._build_converters(header)
+            
+            # The first load of a long file also goes through csv.reader: a numpy.loadtxt
+            # bulk parse measured no faster, since building the output dicts dominates
+            new_metrics = []
+            converters = self._converters
+            for row in csv.reader(lines):
+                if not row:
+                    continue
+                n = len(row)
+                point = {}
+                for i, name, conv in converters:
+                    if i < n and row[i]:
+                        value = conv(row[i])
+                        if value is not None:
+                            point[name] = value
+                new_metrics.append(point)
+            
+            self._header = header
+            self._offset += end
+            self._cache.extend(new_metrics)
+            self._last_mtime = st.st_mtime
+            self._size = st.st_size
+            self._inode = st.st_ino
+            return self._cache
             
         except Exception as e:
             logger.error(f"Error reading CSV metrics: {e}")
-            return self._cache[-limit:] if self._cache else [], "csv"
+            return self._cache
     
-    def stream_metrics(self) -> Generator[str, None, None]:
+    async def stream_metrics(self) -> AsyncGenerator[bytes, None]:
         """Stream CSV metrics as SSE"""
         last_step = -1
         
         while True:
             try:
-                metrics, _ = self.get_recent_metrics(limit=0)  # Get all metrics
+                metrics, _ = await asyncio.to_thread(self.get_recent_metrics, 0)  # Get all metrics
                 
                 # Find new metrics by step number
                 new_metrics = []
@@ -296,16 +759,16 @@ class CSVMetricsReader:
                     
                     # Send new metrics
                     for metric in new_metrics:
-                        yield f"data: {json.dumps(metric)}\n\n"
+                        yield _sse_frame(metric)
                         last_step = max(last_step, metric.get('step', -1))
                 
                 # Heartbeat
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-                time.sleep(1.0)
+                yield _HB
+                await asyncio.sleep(1.0)
                 
             except Exception as e:
                 logger.error(f"CSV stream error: {e}")
-                time.sleep(2.0)
+                await asyncio.sleep(2.0)
 
 
 class MetricsManager:
@@ -338,26 +801,62 @@ class MetricsManager:
             "count": len(metrics)
         }
     
-    def stream(self, source: Optional[str] = None) -> Generator[str, None, None]:
+    def close(self) -> None:
+        """Stop background work owned by the readers"""
+        self.tb_reader.close()
+    
+    async def stream(self, source: Optional[str] = None) -> AsyncGenerator[bytes, None]:
         """Stream metrics from specified or best available source"""
         
         if source == "tb":
-            yield from self.tb_reader.stream_metrics()
+            reader = self.tb_reader
         elif source == "csv":
-            yield from self.csv_reader.stream_metrics()
+            reader = self.csv_reader
         else:
             # Auto-detect
-            tb_metrics, tb_src = self.tb_reader.get_recent_metrics(limit=1)
+            tb_metrics, tb_src = await asyncio.to_thread(self.tb_reader.get_recent_metrics, 1)
             if tb_metrics and tb_src == "tensorboard":
-                yield from self.tb_reader.stream_metrics()
+                reader = self.tb_reader
             else:
-                yield from self.csv_reader.stream_metrics()
+                reader = self.csv_reader
+                
+        async for frame in reader.stream_metrics():
+            yield frame
+
+
+# Managers are cached per output so reader state (accumulator, reload timer,
+# CSV offsets) survives across requests
+_MANAGER_CACHE_SIZE = 64
+_managers: "OrderedDict[Tuple[str, str], MetricsManager]" = OrderedDict()
+_managers_lock = threading.Lock()
+
+
+def _get_manager(output_name: str, outputs_dir_abs: str) -> MetricsManager:
+    """Return the cached manager for (output_name, outputs_dir_abs), creating it if needed"""
+    key = (output_name, outputs_dir_abs)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = MetricsManager(output_name, Path(outputs_dir_abs))
+            _managers[key] = manager
+            if len(_managers) > _MANAGER_CACHE_SIZE:
+                _managers.popitem(last=False)[1].close()
+        else:
+            _managers.move_to_end(key)
+        return manager
+
+
+def invalidate_metrics_manager(output_name: str) -> None:
+    """Drop cached managers for an output, e.g. when its training run restarts"""
+    with _managers_lock:
+        for key in [k for k in _managers if k[0] == output_name]:
+            _managers.pop(key).close()
 
 
 # FastAPI integration helpers
 def create_metrics_manager(output_name: str, outputs_dir: str = "outputs") -> MetricsManager:
-    """Create a metrics manager for the given output"""
-    return MetricsManager(output_name, Path(outputs_dir))
+    """Get the metrics manager for the given output"""
+    return _get_manager(output_name, str(Path(outputs_dir).resolve()))
 
 
 def get_recent_metrics_endpoint(
@@ -371,11 +870,18 @@ def get_recent_metrics_endpoint(
     return manager.get_recent(limit, source)
 
 
-def stream_metrics_endpoint(
+async def stream_metrics_endpoint(
     name: str,
     source: Optional[str] = None,
     outputs_dir: str = "outputs"
-) -> Generator[str, None, None]:
-    """FastAPI SSE endpoint handler for streaming metrics"""
+) -> AsyncGenerator[bytes, None]:
+    """FastAPI SSE endpoint handler for streaming metrics.
+
+    Runs on the event loop: waits between polls don't hold a worker thread and
+    file reads go through asyncio.to_thread. Frames are already encoded bytes; wrap in
+    StreamingResponse(..., media_type="text/event-stream") without re-encoding and send
+    an ``X-Accel-Buffering: no`` header so nginx flushes every frame immediately.
+    """
     manager = create_metrics_manager(name, outputs_dir)
-    yield from manager.stream(source)
\ No newline at end of file
+    async for frame in manager.stream(source):
+        yield frame
\ No newline at end of file
@@ -0,0 +1,267 @@
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tensorboard_metrics
+from tensorboard_metrics import CSVMetricsReader, TensorBoardMetricsReader
+
+
+HEADER = "step,epoch,loss,lr\n"
+
+
+def _rows(start, stop):
+    return "".join(f"{i},0,{i / 100:.2f},0.0001\n" for i in range(start, stop))
+
+
+def _steps(metrics):
+    return [m["step"] for m in metrics]
+
+
+def test_csv_reader_picks_up_appends(tmp_path):
+    path = tmp_path / "run_metrics.csv"
+    path.write_text(HEADER + _rows(0, 10))
+    reader = CSVMetricsReader(str(path))
+
+    metrics, source = reader.get_recent_metrics(0)
+    assert source == "csv"
+    assert _steps(metrics) == list(range(10))
+    assert metrics[3] == {"step": 3, "epoch": 0.0, "loss": 0.03, "lr": 0.0001}
+
+    with open(path, "a") as f:
+        f.write(_rows(10, 20))
+    metrics, _ = reader.get_recent_metrics(0)
+    assert _steps(metrics) == list(range(20))
+    assert _steps(reader.get_recent_metrics(5)[0]) == list(range(15, 20))
+
+
+def test_csv_reader_returns_a_snapshot(tmp_path):
+    path = tmp_path / "run_metrics.csv"
+    path.write_text(HEADER + _rows(0, 10))
+    reader = CSVMetricsReader(str(path))
+
+    first, _ = reader.get_recent_metrics(0)
+    with open(path, "a") as f:
+        f.write(_rows(10, 20))
+    reader.get_recent_metrics(0)
+    assert len(first) == 10
+
+
+def test_csv_reader_concurrent_appends(tmp_path, monkeypatch):
+    class SlowFile:
+        # Widen the window between seeking to the offset and committing the new one
+        def __init__(self, f):
+            self._f = f
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self._f.close()
+
+        def seek(self, offset):
+            return self._f.seek(offset)
+
+        def read(self):
+            time.sleep(0.02)
+            return self._f.read()
+
+    def slow_open(*args, **kwargs):
+        return SlowFile(open(*args, **kwargs))
+
+    monkeypatch.setattr(tensorboard_metrics, "open", slow_open, raising=False)
+    path = tmp_path / "run_metrics.csv"
+    path.write_text(HEADER + _rows(0, 10))
+    reader = CSVMetricsReader(str(path))
+    reader.get_recent_metrics(0)
+
+    for chunk in range(1, 6):
+        with open(path, "a") as f:
+            f.write(_rows(chunk * 10, chunk * 10 + 10))
+        barrier = threading.Barrier(8)
+
+        def poll():
+            barrier.wait()
+            reader.get_recent_metrics(0)
+
+        threads = [threading.Thread(target=poll) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    metrics, _ = reader.get_recent_metrics(0)
+    assert _steps(metrics) == list(range(60))
+    assert reader._offset == path.stat().st_size
+
+
+def test_csv_reader_partial_row_waits_for_newline(tmp_path):
+    path = tmp_path / "run_metrics.csv"
+    path.write_text(HEADER + _rows(0, 3) + "3,0,0.0")
+    reader = CSVMetricsReader(str(path))
+    assert _steps(reader.get_recent_metrics(0)[0]) == [0, 1, 2]
+
+    with open(path, "a") as f:
+        f.write("3,0.0001\n")
+    metrics, _ = reader.get_recent_metrics(0)
+    assert _steps(metrics) == [0, 1, 2, 3]
+    assert metrics[-1]["loss"] == 0.03
+
+
+def test_csv_reader_truncation_and_rotation(tmp_path):
+    path = tmp_path / "run_metrics.csv"
+    path.write_text(HEADER + _rows(0, 20))
+    reader = CSVMetricsReader(str(path))
+    assert len(reader.get_recent_metrics(0)[0]) == 20
+
+    # Truncated in place: start over, including the header
+    path.write_text("step,loss\n" + "".join(f"{i},1.5\n" for i in range(3)))
+    metrics, _ = reader.get_recent_metrics(0)
+    assert metrics == [{"step": i, "loss": 1.5} for i in range(3)]
+
+    # Replaced by a new file at least as large: the inode change resets the reader
+    rotated = tmp_path / "rotated.csv"
+    rotated.write_text(HEADER + _rows(100, 130))
+    rotated.replace(path)
+    assert _steps(reader.get_recent_metrics(0)[0]) == list(range(100, 130))
+
+
+def _stub_scalars(reader, batches):
+    reader._read_new_scalars = lambda: batches.pop(0)
+    # Tags are seeded so the first batch does not trigger a tag re-selection
+    reader._tags = dict.fromkeys(["loss", "lr", "grad_norm"])
+
+
+def test_tb_merge_out_of_order_steps():
+    reader = TensorBoardMetricsReader("/nonexistent")
+    batches = [
+        [("loss", 0, 1.0, 0.5), ("loss", 1, 2.0, 0.4), ("lr", 0, 1.0, 1e-4)],
+        [("loss", 4, 5.0, 0.2), ("lr", 1, 2.0, 2e-4), ("grad_norm", 4, 5.0, 3.0)],
+        # late steps land before the newest row
+        [("loss", 2, 3.0, 0.3), ("loss", 3, 4.0, 0.25), ("grad_norm", 0, 1.0, 1.0)],
+        [],
+    ]
+    _stub_scalars(reader, batches)
+
+    reader._read_metrics()
+    metrics, _ = reader._read_metrics()
+    assert [m["step"] for m in metrics] == [0, 1, 4]
+    assert metrics[1] == {"step": 1, "ts": 2.0, "loss": 0.4, "lr": 2e-4}
+    assert metrics[2]["grad_norm"] == 3.0
+
+    metrics, _ = reader._read_metrics()
+    assert [m["step"] for m in metrics] == [0, 1, 2, 3, 4]
+    assert metrics[0] == {"step": 0, "ts": 1.0, "loss": 0.5, "lr": 1e-4, "grad_norm": 1.0}
+    assert reader._read_metrics()[0] == metrics
+
+
+def test_tb_history_is_thinned_across_the_run():
+    reader = TensorBoardMetricsReader("/nonexistent")
+    reader._max_points = 8
+    batches = [[("loss", s, float(s), 1.0) for s in range(i, i + 7)] for i in range(0, 98, 7)]
+    batches.append([("loss", 98, 98.0, 1.0), ("loss", 99, 99.0, 1.0)])
+    _stub_scalars(reader, batches)
+
+    for _ in range(len(batches)):
+        metrics, _ = reader._read_metrics()
+    # Evenly spaced from the first step, and the newest step is kept
+    assert [m["step"] for m in metrics] == [0, 16, 32, 48, 64, 80, 96, 99]
+    assert len(reader._points) == len(reader._ordered) == len(metrics)
+
+
+def test_tb_close_is_final():
+    reader = TensorBoardMetricsReader("/nonexistent")
+    reader.close()
+    reader._ensure_refresher()
+    assert reader._refresher is None
+
+
+def _event_record(step, tags):
+    pytest.importorskip("tensorboard")
+    from tensorboard.compat.proto import event_pb2, summary_pb2
+
+    event = event_pb2.Event(
+        wall_time=1000.0 + step,
+        step=step,
+        summary=summary_pb2.Summary(
+            value=[summary_pb2.Summary.Value(tag=tag, simple_value=value) for tag, value in tags]
+        ),
+    )
+    payload = event.SerializeToString()
+    masked_crc, _ = tensorboard_metrics._masked_crc32c_fn()
+    header = struct.pack("<Q", len(payload))
+    return (
+        header
+        + struct.pack("<I", masked_crc(header))
+        + payload
+        + struct.pack("<I", masked_crc(payload))
+    )
+
+
+def test_read_scalar_events_torn_record(tmp_path, monkeypatch):
+    # Tiny chunks so records straddle read boundaries
+    monkeypatch.setattr(tensorboard_metrics, "_READ_CHUNK", 7)
+    records = [_event_record(i, [("loss", i / 10)]) for i in range(3)]
+    path = tmp_path / "events.out.tfevents.1"
+    path.write_bytes(records[0] + records[1] + records[2][:10])
+
+    scalars, offset, intact = tensorboard_metrics._read_scalar_events(str(path), 0)
+    assert intact
+    assert [s[1] for s in scalars] == [0, 1]
+    assert offset == len(records[0]) + len(records[1])
+
+    with open(path, "ab") as f:
+        f.write(records[2][10:])
+    scalars, end, intact = tensorboard_metrics._read_scalar_events(str(path), offset)
+    assert intact
+    assert scalars == [("loss", 2, 1002.0, pytest.approx(0.2))]
+    assert end == path.stat().st_size
+
+
+def test_read_scalar_events_corrupt_records(tmp_path):
+    records = [_event_record(i, [("loss", 1.0)]) for i in range(3)]
+    path = tmp_path / "events.out.tfevents.1"
+
+    # Bad payload checksum: that record is skipped, the rest still read
+    bad_payload = bytearray(records[1])
+    bad_payload[-6] ^= 0xFF
+    path.write_bytes(records[0] + bytes(bad_payload) + records[2])
+    scalars, offset, intact = tensorboard_metrics._read_scalar_events(str(path), 0)
+    assert intact
+    assert [s[1] for s in scalars] == [0, 2]
+    assert offset == path.stat().st_size
+
+    # Bad length header: record boundaries are lost, stop before it
+    bad_header = bytearray(records[1])
+    bad_header[0] ^= 0x01
+    path.write_bytes(records[0] + bytes(bad_header) + records[2])
+    scalars, offset, intact = tensorboard_metrics._read_scalar_events(str(path), 0)
+    assert not intact
+    assert [s[1] for s in scalars] == [0]
+    assert offset == len(records[0])
+
+
+def test_tb_reader_reads_appended_events(tmp_path):
+    run_dir = tmp_path / "tb" / "run"
+    run_dir.mkdir(parents=True)
+    path = run_dir / "events.out.tfevents.1"
+    path.write_bytes(b"".join(_event_record(i, [("loss", 1.0), ("lr", 1e-4)]) for i in range(5)))
+    reader = TensorBoardMetricsReader(str(tmp_path / "tb"))
+    reader._idle_timeout = -1  # keep the refresher thread out of the test
+
+    metrics, source = reader.get_recent_metrics(0)
+    assert source == "tensorboard"
+    assert [m["step"] for m in metrics] == list(range(5))
+
+    with open(path, "ab") as f:
+        f.write(b"".join(_event_record(i, [("loss", 0.5)]) for i in range(5, 8)))
+    reader._refresh()
+    metrics, _ = reader.get_recent_metrics(3)
+    assert metrics == [{"step": i, "ts": 1000.0 + i, "loss": 0.5} for i in range(5, 8)]
+    reader.close()
@@ -1,52 +1,185 @@
 import os
 import sys
+import importlib.util
 import yaml
 import shutil
 import json
+import functools
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from slugify import slugify
 from huggingface_hub import hf_hub_download
 from PIL import Image
 
+try:
+    import pyvips  # optional, faster dataset image resizing
+except Exception:
+    pyvips = None
+
 HERE = os.path.dirname(os.path.abspath(__file__))
 ROOT = os.path.dirname(HERE)
 # Base models directory can be overridden by env var to unify with API
 BASE_MODELS_DIR = os.environ.get('KIKO_MODELS_DIR', os.path.join(ROOT, 'models'))
 
 
+# (mtime, parsed models.yaml); re-parsed only when the file changes
+_models_cache = None
+# libyaml's C loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
 def load_models_yaml():
+    global _models_cache
     models_path = os.path.join(ROOT, 'models.yaml')
+    mtime = os.stat(models_path).st_mtime
+    cached = _models_cache
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
     with open(models_path, 'r') as f:
-        return yaml.safe_load(f)
+        models = yaml.load(f, Loader=_YAML_LOADER)
+    _models_cache = (mtime, models)
+    return models
 
 
+# Pure functions of ROOT (fixed at import) and p; gen_sh resolves the same few paths repeatedly
+@functools.lru_cache(maxsize=256)
 def resolve_path(p: str) -> str:
     norm_path = os.path.normpath(os.path.join(ROOT, p))
     return f'"{norm_path}"'
 
 
+@functools.lru_cache(maxsize=256)
 def resolve_path_without_quotes(p: str) -> str:
     norm_path = os.path.normpath(os.path.join(ROOT, p))
     return norm_path
 
 
-def resize_image(image_path: str, output_path: str, size: int):
+_ROOT_PREFIX = ROOT + os.sep
+
+
+def _relpath_to_root(p: str) -> str:
+    # Paths under ROOT just drop the prefix; anything else (or "ROOT//x") takes the general route
+    if p.startswith(_ROOT_PREFIX):
+        rel = p.removeprefix(_ROOT_PREFIX)
+        if not os.path.isabs(rel):
+            return rel
+    return os.path.relpath(p, ROOT)
+
+
+def _resize_dims(width: int, height: int, size: int) -> tuple[int, int]:
+    if width < height:
+        return size, int((size/width) * height)
+    return int((size/height) * width), size
+
+
+def _vips_resize(image_path: str, output_path: str, size: int):
+    img = pyvips.Image.new_from_file(image_path, access='sequential')
+    new_width, new_height = _resize_dims(img.width, img.height, size)
+    img = img.resize(new_width / img.width, vscale=new_height / img.height, kernel='lanczos3')
+    img.write_to_file(output_path)
+
+
+_REDUCIBLE_MODES = frozenset(("L", "LA", "RGB", "RGBA", "CMYK", "I", "F"))
+
+
+def _pil_resize(image_path: str, output_path: str, size: int):
     with Image.open(image_path) as img:
-        width, height = img.size
-        if width < height:
-            new_width = size
-            new_height = int((size/width) * height)
-        else:
-            new_height = size
-            new_width = int((size/height) * width)
-        img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        new_width, new_height = _resize_dims(*img.size, size)
+        # JPEGs can decode straight at 1/2, 1/4 or 1/8 scale, never below the target;
+        # a no-op for other formats and when upscaling
+        img.draft(img.mode, (new_width, new_height))
+        src = img
+        # Integer box pre-reduction down to ~3x the target, then LANCZOS. Pillow skips
+        # resize(reducing_gap=...) for RGBA/LA, so do it explicitly; reduce() rejects
+        # modes such as P, 1 and I;16, which take the plain resize
+        factor = min(img.width // new_width, img.height // new_height) // 3
+        if factor >= 2 and img.mode in _REDUCIBLE_MODES:
+            src = img.reduce(factor)
+        img_resized = src.resize((new_width, new_height), Image.Resampling.LANCZOS)
         img_resized.save(output_path)
 
 
+# libvips streams and fuses the resize when available; Pillow otherwise
+resize_image = _vips_resize if pyvips is not None else _pil_resize
+
+
+def resize_images(tasks, max_workers: int | None = None) -> None:
+    """Run resize_image over (image_path, output_path, size) tuples on a thread pool"""
+    tasks = list(tasks)
+    if not tasks:
+        return
+    # Decoders and resamplers in both Pillow and libvips release the GIL
+    workers = min(len(tasks), max_workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Consuming the results re-raises the first failure
+        for _ in pool.map(lambda task: resize_image(*task), tasks):
+            pass
+
+
+def _ls(path: str) -> set[str]:
+    """Names in a directory from a single scandir; empty if it does not exist"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name for entry in it}
+    except OSError:
+        return set()
+
+
+_TRUTHY = ("1", "true", "yes", "on")
+
+
+def _set_hf_transfer(enabled: bool):
+    os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1" if enabled else "0"
+    # huggingface_hub reads the variable once at import; update its copy too
+    try:
+        from huggingface_hub import constants
+        if hasattr(constants, "HF_HUB_ENABLE_HF_TRANSFER"):
+            constants.HF_HUB_ENABLE_HF_TRANSFER = enabled
+    except Exception:
+        pass
+
+
+def _setup_hf_transfer():
+    """Use the multi-connection hf_transfer backend when installed (opt out: KIKO_DISABLE_HF_TRANSFER=1)"""
+    if os.environ.get("KIKO_DISABLE_HF_TRANSFER", "").lower() in _TRUTHY:
+        _set_hf_transfer(False)
+    elif importlib.util.find_spec("hf_transfer") is None:
+        # Requesting it without the package makes every download fail
+        _set_hf_transfer(False)
+    else:
+        _set_hf_transfer(os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1").lower() in _TRUTHY)
+
+
+def _hf_download(**task):
+    try:
+        return hf_hub_download(**task)
+    except (ImportError, ValueError) as e:
+        if "hf_transfer" not in str(e):
+            raise
+        # hf_transfer is broken in this environment: retry once with the default downloader
+        _set_hf_transfer(False)
+        return hf_hub_download(**task)
+
+
+# Directories this process has already created or found via makedirs
+_ENSURED_DIRS: set[str] = set()
+
+
+def _ensure_dir(path: str) -> None:
+    if path not in _ENSURED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _ENSURED_DIRS.add(path)
+
+
 def download(base_model: str):
+    _setup_hf_transfer()
     models = load_models_yaml()
     model = models[base_model]
     model_file = model["file"]
     repo = model["repo"]
+    # Collect missing files first, then fetch them concurrently. hf_hub_download writes
+    # to a .incomplete file and renames it into place, so a listed file is complete.
+    tasks: list[dict] = []
 
     # download unet
     if base_model in ("flux-dev", "flux-schnell"):
@@ -54,34 +187,247 @@ def download(base_model: str):
     else:
         unet_folder = os.path.join(BASE_MODELS_DIR, f"unet/{repo}")
     unet_path = os.path.join(unet_folder, model_file)
-    if not os.path.exists(unet_path):
-        os.makedirs(unet_folder, exist_ok=True)
-        hf_hub_download(repo_id=repo, local_dir=unet_folder, filename=model_file)
+    if os.path.basename(unet_path) not in _ls(os.path.dirname(unet_path)):
+        tasks.append(dict(repo_id=repo, local_dir=unet_folder, filename=model_file))
 
     # download vae
     vae_folder = os.path.join(BASE_MODELS_DIR, "vae")
-    vae_path = os.path.join(vae_folder, "ae.sft")
-    if not os.path.exists(vae_path):
-        os.makedirs(vae_folder, exist_ok=True)
-        hf_hub_download(repo_id="cocktailpeanut/xulf-dev", local_dir=vae_folder, filename="ae.sft")
+    if "ae.sft" not in _ls(vae_folder):
+        tasks.append(dict(repo_id="cocktailpeanut/xulf-dev", local_dir=vae_folder, filename="ae.sft"))
 
     # download clip
     clip_folder = os.path.join(BASE_MODELS_DIR, "clip")
+    clip_files = _ls(clip_folder)
+    base_files = None  # top-level listing, only needed when a text encoder is missing
     # Support either nested 'clip/clip_l.safetensors' or top-level 'clip_l.safetensors'
-    clip_l_path = os.path.join(clip_folder, "clip_l.safetensors")
-    if not os.path.exists(clip_l_path):
+    if "clip_l.safetensors" not in clip_files:
         # If top-level exists, don't redownload
-        top_level_clip = os.path.join(BASE_MODELS_DIR, "clip_l.safetensors")
-        if not os.path.exists(top_level_clip):
-            os.makedirs(clip_folder, exist_ok=True)
-            hf_hub_download(repo_id="comfyanonymous/flux_text_encoders", local_dir=clip_folder, filename="clip_l.safetensors")
+        base_files = _ls(BASE_MODELS_DIR)
+        if "clip_l.safetensors" not in base_files:
+            tasks.append(dict(repo_id="comfyanonymous/flux_text_encoders", local_dir=clip_folder, filename="clip_l.safetensors"))
 
     # download t5xxl
-    t5xxl_path = os.path.join(clip_folder, "t5xxl_fp16.safetensors")
-    if not os.path.exists(t5xxl_path):
-        top_level_t5 = os.path.join(BASE_MODELS_DIR, "t5xxl_fp16.safetensors")
-        if not os.path.exists(top_level_t5):
-            hf_hub_download(repo_id="comfyanonymous/flux_text_encoders", local_dir=clip_folder, filename="t5xxl_fp16.safetensors")
+    if "t5xxl_fp16.safetensors" not in clip_files:
+        if base_files is None:
+            base_files = _ls(BASE_MODELS_DIR)
+        if "t5xxl_fp16.safetensors" not in base_files:
+            tasks.append(dict(repo_id="comfyanonymous/flux_text_encoders", local_dir=clip_folder, filename="t5xxl_fp16.safetensors"))
+
+    if tasks:
+        for task in tasks:
+            _ensure_dir(task["local_dir"])
+        workers = max(1, int(os.environ.get("KIKO_PARALLEL_DOWNLOADS", "4")))
+        # hf_transfer already opens many connections per file; don't stack threads on top
+        if os.environ.get("HF_HUB_ENABLE_HF_TRANSFER", "").lower() in _TRUTHY:
+            workers = min(workers, 2)
+        with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(_hf_download, **task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # Don't start downloads that are still queued
+                for future in futures:
+                    future.cancel()
+                raise
+
+    # Files may have landed in subfolders the mtime check does not see
+    _invalidate_model_index()
+
+
+def _split_dir(top: str) -> tuple[list[tuple[str, str]], list[str]]:
+    """(name, path) of the files directly in top, and the subdirectories to descend into"""
+    try:
+        with os.scandir(top) as it:
+            entries = list(it)
+    except OSError:
+        return [], []
+    files = []
+    subdirs = []
+    # Like os.walk: symlinked directories are listed but not descended into
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            files.append((entry.name, entry.path))
+        elif not entry.is_symlink():
+            subdirs.append(entry.path)
+    return files, subdirs
+
+
+def _iter_files(top: str):
+    """Yield (name, path) for files under top via scandir, in os.walk order"""
+    # Like os.walk: a directory's files come before its subdirectories
+    files, subdirs = _split_dir(top)
+    yield from files
+    for sub in subdirs:
+        yield from _iter_files(sub)
+
+
+def _walk_models_dir() -> list[tuple[str, str]]:
+    """All files under BASE_MODELS_DIR in os.walk order, top-level subdirs walked in parallel"""
+    files, subdirs = _split_dir(BASE_MODELS_DIR)
+    if len(subdirs) > 1:
+        # scandir releases the GIL; on cold caches/network mounts the per-folder walks overlap
+        with ThreadPoolExecutor(max_workers=min(4, len(subdirs))) as pool:
+            parts = list(pool.map(lambda sub: list(_iter_files(sub)), subdirs))
+    else:
+        parts = [list(_iter_files(sub)) for sub in subdirs]
+    # Merge in submission order so first-match-wins lookups see the same order as a serial walk
+    for part in parts:
+        files.extend(part)
+    return files
+
+
+# Lazy filename index of BASE_MODELS_DIR, rebuilt when its mtime changes or after download().
+# Held as one (mtime, by name, by stem, files) tuple and swapped whole, so a lookup that
+# races download()'s invalidation keeps using the index it already has.
+_MODEL_INDEX: tuple[float | None, dict[str, str], dict[str, str], list[tuple[str, str]]] | None = None
+
+
+def _invalidate_model_index() -> None:
+    global _MODEL_INDEX
+    _MODEL_INDEX = None
+
+
+def _build_model_index(models_mtime: float | None) -> tuple[float | None, dict[str, str], dict[str, str], list[tuple[str, str]]]:
+    global _MODEL_INDEX
+    files = [(fn.lower(), path) for fn, path in _walk_models_dir()]
+    index: dict[str, str] = {}
+    by_stem: dict[str, str] = {}
+    # Keep the first file in walk order for duplicate names, as the scan did
+    for name, path in files:
+        index.setdefault(name, path)
+        by_stem.setdefault(os.path.splitext(name)[0], path)
+    model_index = (models_mtime, index, by_stem, files)
+    _MODEL_INDEX = model_index
+    return model_index
+
+
+def _lookup_model_file(target: str) -> str | None:
+    """Find a model file under BASE_MODELS_DIR by exact name, stem, or substring"""
+    try:
+        models_mtime = os.stat(BASE_MODELS_DIR).st_mtime
+    except OSError:
+        models_mtime = None
+    model_index = _MODEL_INDEX
+    fresh = model_index is None or model_index[0] != models_mtime
+    if fresh:
+        model_index = _build_model_index(models_mtime)
+    while True:
+        _, index, by_stem, files = model_index
+        hit = index.get(target) or by_stem.get(target)
+        if hit is None:
+            for name, path in files:
+                if target in name:
+                    hit = path
+                    break
+        if hit is not None and os.path.lexists(hit):
+            return hit
+        # An old index can miss a file added in a subfolder, or hit one since
+        # deleted or renamed; neither changes the top-level mtime
+        if fresh:
+            return None
+        model_index = _build_model_index(models_mtime)
+        fresh = True
+
+
+def _resolve_component_paths() -> tuple[str, str, str]:
+    """Quoted clip_l, t5xxl and VAE paths"""
+    # Resolve component paths with fallbacks (nested subfolders vs top-level files)
+    def _first_existing(paths):
+        for p in paths:
+            if os.path.exists(p):
+                return p
+        return paths[0]
+
+    clip_abs = _first_existing([
+        os.path.join(BASE_MODELS_DIR, "clip/clip_l.safetensors"),
+        os.path.join(BASE_MODELS_DIR, "clip_l.safetensors"),
+    ])
+    t5_abs = _first_existing([
+        os.path.join(BASE_MODELS_DIR, "clip/t5xxl_fp16.safetensors"),
+        os.path.join(BASE_MODELS_DIR, "t5xxl_fp16.safetensors"),
+    ])
+    ae_abs = _first_existing([
+        os.path.join(BASE_MODELS_DIR, "vae/ae.sft"),
+        os.path.join(BASE_MODELS_DIR, "ae.sft"),
+    ])
+
+    clip_path = resolve_path(_relpath_to_root(clip_abs))
+    t5_path = resolve_path(_relpath_to_root(t5_abs))
+    ae_path = resolve_path(_relpath_to_root(ae_abs))
+    return clip_path, t5_path, ae_path
+
+
+def _resolve_model_paths(base_model, pretrained_override: str | None) -> tuple[str, str, str, str]:
+    # Resolve pretrained UNet path purely from user-provided selection; avoid models.yaml
+    def _resolve_pretrained(pth: str | None) -> str:
+        if not pth and isinstance(base_model, str):
+            pth = base_model
+        if pth:
+            # absolute or relative to ROOT
+            abs_path = pth if os.path.isabs(pth) else os.path.normpath(os.path.join(ROOT, pth))
+            if os.path.exists(abs_path):
+                return resolve_path(_relpath_to_root(abs_path))
+        # Try to find by name under BASE_MODELS_DIR recursively
+        if isinstance(base_model, str):
+            cand = _lookup_model_file(base_model.lower())
+            if cand is not None:
+                return resolve_path(_relpath_to_root(cand))
+        raise ValueError("Pretrained model path not provided or not found. Select a local model in the UI.")
+
+    pretrained_model_path = _resolve_pretrained(pretrained_override)
+    clip_path, t5_path, ae_path = _resolve_component_paths()
+    return pretrained_model_path, clip_path, t5_path, ae_path
+
+
+@functools.lru_cache(maxsize=64)
+def _static_sh_blocks(mp: str, vram, lr_scheduler: str | None, sep: str) -> tuple[str, str, str, str, str]:
+    """Pre-joined runs of gen_sh flags that only vary with precision/VRAM/scheduler"""
+    if vram == "16G":
+        optimizer_flags = (
+            "--optimizer_type adafactor",
+            "--optimizer_args \"relative_step=False\" \"scale_parameter=False\" \"warmup_init=False\"",
+            f"--lr_scheduler {lr_scheduler or 'constant_with_warmup'}",
+            "--max_grad_norm 0.0",
+        )
+    elif vram == "12G":
+        optimizer_flags = (
+            "--optimizer_type adafactor",
+            "--optimizer_args \"relative_step=False\" \"scale_parameter=False\" \"warmup_init=False\"",
+            "--split_mode",
+            "--network_args \"train_blocks=single\"",
+            f"--lr_scheduler {lr_scheduler or 'constant_with_warmup'}",
+            "--max_grad_norm 0.0",
+        )
+    else:
+        optimizer_flags = ("--optimizer_type adamw8bit",)
+    return (
+        sep.join((
+            "accelerate launch",
+            f"--mixed_precision {mp}",
+            "--num_cpu_threads_per_process 1",
+            "sd-scripts/flux_train_network.py",
+        )),
+        sep.join((
+            "--cache_latents_to_disk",
+            "--save_model_as safetensors",
+            "--sdpa",
+            "--persistent_data_loader_workers",
+        )),
+        sep.join((
+            "--gradient_checkpointing",
+            # sd-scripts expects mixed_precision as a script arg as well
+            f"--mixed_precision {mp}",
+            "--save_precision bf16",
+            "--network_module networks.lora_flux",
+        )),
+        sep.join(optimizer_flags),
+        sep.join(("--discrete_flow_shift 3.1582", "--model_prediction_type raw")),
+    )
 
 
 def gen_sh(
@@ -123,119 +469,28 @@ def gen_sh(
 
     line_break = "\\" if os.name != 'nt' else "^"
     file_type = "sh" if os.name != 'nt' else "bat"
+    # Continuation between arguments; optional flags below carry their own leading one
+    sep = f" {line_break}\n  "
 
-    sample_flags = []
+    sample_flags = ""
     if sample_prompts and sample_every_n_steps and int(sample_every_n_steps) > 0:
-        sample_flags.append(f"--sample_prompts {sample_prompts_path}")
-        sample_flags.append(f"--sample_every_n_steps {sample_every_n_steps}")
-
-    optimizer_flags = []
-    if vram == "16G":
-        optimizer_flags = [
-            "--optimizer_type adafactor",
-            "--optimizer_args \"relative_step=False\" \"scale_parameter=False\" \"warmup_init=False\"",
-            f"--lr_scheduler {lr_scheduler or 'constant_with_warmup'}",
-            "--max_grad_norm 0.0",
-        ]
-    elif vram == "12G":
-        optimizer_flags = [
-            "--optimizer_type adafactor",
-            "--optimizer_args \"relative_step=False\" \"scale_parameter=False\" \"warmup_init=False\"",
-            "--split_mode",
-            "--network_args \"train_blocks=single\"",
-            f"--lr_scheduler {lr_scheduler or 'constant_with_warmup'}",
-            "--max_grad_norm 0.0",
-        ]
-    else:
-        optimizer_flags = ["--optimizer_type adamw8bit"]
-
-    # Resolve pretrained UNet path purely from user-provided selection; avoid models.yaml
-    def _resolve_pretrained(pth: str | None) -> str:
-        if not pth and isinstance(base_model, str):
-            pth = base_model
-        if pth:
-            # absolute or relative to ROOT
-            abs_path = pth if os.path.isabs(pth) else os.path.normpath(os.path.join(ROOT, pth))
-            if os.path.exists(abs_path):
-                return resolve_path(os.path.relpath(abs_path, ROOT))
-        # Try to find by name under BASE_MODELS_DIR recursively
-        if isinstance(base_model, str):
-            target = base_model.lower()
-            for dirpath, _, filenames in os.walk(BASE_MODELS_DIR):
-                for fn in filenames:
-                    if target in fn.lower():
-                        cand = os.path.join(dirpath, fn)
-                        return resolve_path(os.path.relpath(cand, ROOT))
-        raise ValueError("Pretrained model path not provided or not found. Select a local model in the UI.")
-
-    pretrained_model_path = _resolve_pretrained(pretrained_override)
-
-    # Resolve component paths with fallbacks (nested subfolders vs top-level files)
-    def _first_existing(paths):
-        for p in paths:
-            if os.path.exists(p):
-                return p
-        return paths[0]
-
-    clip_abs = _first_existing([
-        os.path.join(BASE_MODELS_DIR, "clip/clip_l.safetensors"),
-        os.path.join(BASE_MODELS_DIR, "clip_l.safetensors"),
-    ])
-    t5_abs = _first_existing([
-        os.path.join(BASE_MODELS_DIR, "clip/t5xxl_fp16.safetensors"),
-        os.path.join(BASE_MODELS_DIR, "t5xxl_fp16.safetensors"),
-    ])
-    ae_abs = _first_existing([
-        os.path.join(BASE_MODELS_DIR, "vae/ae.sft"),
-        os.path.join(BASE_MODELS_DIR, "ae.sft"),
-    ])
+        sample_flags = f"{sep}--sample_prompts {sample_prompts_path}{sep}--sample_every_n_steps {sample_every_n_steps}"
 
-    clip_path = resolve_path(os.path.relpath(clip_abs, ROOT))
-    t5_path = resolve_path(os.path.relpath(t5_abs, ROOT))
-    ae_path = resolve_path(os.path.relpath(ae_abs, ROOT))
+    pretrained_model_path, clip_path, t5_path, ae_path = _resolve_model_paths(base_model, pretrained_override)
 
-    # Build argument list and join with proper continuations
-    args: list[str] = []
     mp = (mixed_precision or 'bf16').lower()
     if mp not in ('bf16','fp16'):
         mp = 'bf16'
-    args.append("accelerate launch")
-    args.append(f"--mixed_precision {mp}")
-    args.append("--num_cpu_threads_per_process 1")
-    args.append("sd-scripts/flux_train_network.py")
-    args.append(f"--pretrained_model_name_or_path {pretrained_model_path}")
-    args.append(f"--clip_l {clip_path}")
-    args.append(f"--t5xxl {t5_path}")
-    args.append(f"--ae {ae_path}")
-    args.append("--cache_latents_to_disk")
-    args.append("--save_model_as safetensors")
-    args.append("--sdpa")
-    args.append("--persistent_data_loader_workers")
-    args.append(f"--max_data_loader_n_workers {workers}")
-    args.append(f"--seed {seed}")
-    args.append("--gradient_checkpointing")
-    # sd-scripts expects mixed_precision as a script arg as well
-    args.append(f"--mixed_precision {mp}")
-    args.append("--save_precision bf16")
-    args.append("--network_module networks.lora_flux")
-    args.append(f"--network_dim {network_dim}")
-    if network_alpha is not None:
-        args.append(f"--network_alpha {network_alpha}")
-    args.extend(optimizer_flags)
-    args.extend(sample_flags)
-    if sample_sampler:
-        args.append(f"--sample_sampler {sample_sampler}")
-    args.append(f"--learning_rate {learning_rate}")
-    if lr_scheduler and vram not in ("12G", "16G"):
-        args.append(f"--lr_scheduler {lr_scheduler}")
-    if lr_warmup_steps is not None:
-        args.append(f"--lr_warmup_steps {lr_warmup_steps}")
+    launch_block, loader_block, network_block, optimizer_block, flow_block = _static_sh_blocks(
+        mp, vram, lr_scheduler, sep
+    )
+    alpha_flag = f"{sep}--network_alpha {network_alpha}" if network_alpha is not None else ""
+    sampler_flag = f"{sep}--sample_sampler {sample_sampler}" if sample_sampler else ""
+    scheduler_flag = f"{sep}--lr_scheduler {lr_scheduler}" if lr_scheduler and vram not in ("12G", "16G") else ""
+    warmup_flag = f"{sep}--lr_warmup_steps {lr_warmup_steps}" if lr_warmup_steps is not None else ""
     # Text encoder caching cannot be used when training any TE
     train_any_te = bool(train_clip_l) or bool(train_t5xxl)
-    if not train_any_te:
-        args.append("--cache_text_encoder_outputs")
-        args.append("--cache_text_encoder_outputs_to_disk")
-    args.append("--fp8_base")
+    te_cache_flags = "" if train_any_te else f"{sep}--cache_text_encoder_outputs{sep}--cache_text_encoder_outputs_to_disk"
     # Normalize VRAM string (accepts values like '20GB', '24GB+', '16G')
     vram_str = str(vram or "").upper().strip()
     vram_digits = "".join(ch for ch in vram_str if ch.isdigit())
@@ -255,8 +510,7 @@ def gen_sh(
 
     # High VRAM mode: only force when explicitly requested or clearly 24GB+
     should_highvram = bool(force_highvram) or (vram_bucket == "24G")
-    if should_highvram:
-        args.append("--highvram")
+    highvram_flag = f"{sep}--highvram" if should_highvram else ""
 
     # Reduce VRAM during forward/backward by swapping blocks
     eff_blocks_to_swap: int | None = None
@@ -272,57 +526,62 @@ def gen_sh(
             # other processes occupy VRAM; users can turn this off in UI.
             eff_blocks_to_swap = 12
         # 12/16GB are typically constrained; let users choose explicitly.
-    if eff_blocks_to_swap is not None:
-        args.append(f"--blocks_to_swap {eff_blocks_to_swap}")
+    swap_flag = f"{sep}--blocks_to_swap {eff_blocks_to_swap}" if eff_blocks_to_swap is not None else ""
 
     # TensorBoard logging (no sd-scripts patch required)
+    tb_flags = ""
     if enable_tensorboard:
-        tb_dir = resolve_path_without_quotes(f"outputs/{output_name}/tb")
-        args.append(f"--logging_dir {resolve_path(f'outputs/{output_name}/tb')}")
-        args.append("--log_with tensorboard")
+        tb_flags = f"{sep}--logging_dir {resolve_path(f'outputs/{output_name}/tb')}{sep}--log_with tensorboard"
 
     # Text encoder training flags
     if train_any_te:
+        te_flags = ""
         # If not training CLIP-L, use unet_only flag to exclude TE modules
         if not train_clip_l and not train_t5xxl:
-            args.append("--network_train_unet_only")
+            te_flags += f"{sep}--network_train_unet_only"
         # Flux T5 requires explicit network arg
         if train_t5xxl:
-            args.append("--network_args \"train_t5xxl=True\"")
+            te_flags += f'{sep}--network_args "train_t5xxl=True"'
         if text_encoder_lr:
-            args.append(f"--text_encoder_lr {text_encoder_lr}")
+            te_flags += f"{sep}--text_encoder_lr {text_encoder_lr}"
     else:
         # Explicitly train UNet only if neither TE is to be trained
-        args.append("--network_train_unet_only")
-    args.append(f"--max_train_epochs {max_train_epochs}")
-    args.append(f"--save_every_n_epochs {save_every_n_epochs}")
-    args.append(f"--dataset_config {resolve_path(f'outputs/{output_name}/dataset.toml')}")
-    args.append(f"--output_dir {output_dir}")
-    args.append(f"--output_name {output_name}")
-    args.append(f"--timestep_sampling {timestep_sampling}")
-    args.append("--discrete_flow_shift 3.1582")
-    args.append("--model_prediction_type raw")
-    args.append(f"--guidance_scale {guidance_scale}")
-    args.append("--loss_type l2")
-    if noise_offset is not None:
-        args.append(f"--noise_offset {noise_offset}")
-    if network_dropout is not None:
-        args.append(f"--network_dropout {network_dropout}")
-    if rank_dropout is not None:
-        args.append(f"--network_args \"rank_dropout={rank_dropout}\"")
-    if module_dropout is not None:
-        args.append(f"--network_args \"module_dropout={module_dropout}\"")
-
-    sh = " \\\n  ".join(args) + "\n"
-
-    # Final cleanup: ensure no trailing continuation dangling at EOF
-    sh = sh.rstrip()
-    if sh.endswith(line_break):
-        sh = sh[: -len(line_break)]
-    sh += "\n"
+        te_flags = f"{sep}--network_train_unet_only"
+
+    noise_flag = f"{sep}--noise_offset {noise_offset}" if noise_offset is not None else ""
+    dropout_flag = f"{sep}--network_dropout {network_dropout}" if network_dropout is not None else ""
+    rank_dropout_flag = f'{sep}--network_args "rank_dropout={rank_dropout}"' if rank_dropout is not None else ""
+    module_dropout_flag = f'{sep}--network_args "module_dropout={module_dropout}"' if module_dropout is not None else ""
+    dataset_config = resolve_path(f'outputs/{output_name}/dataset.toml')
+
+    # One template; continuations only go between arguments, so nothing dangles at EOF
+    sh = (
+        f"{launch_block}{sep}"
+        f"--pretrained_model_name_or_path {pretrained_model_path}{sep}"
+        f"--clip_l {clip_path}{sep}"
+        f"--t5xxl {t5_path}{sep}"
+        f"--ae {ae_path}{sep}"
+        f"{loader_block}{sep}"
+        f"--max_data_loader_n_workers {workers}{sep}"
+        f"--seed {seed}{sep}"
+        f"{network_block}{sep}"
+        f"--network_dim {network_dim}{alpha_flag}{sep}"
+        f"{optimizer_block}{sample_flags}{sampler_flag}{sep}"
+        f"--learning_rate {learning_rate}{scheduler_flag}{warmup_flag}{te_cache_flags}{sep}"
+        f"--fp8_base{highvram_flag}{swap_flag}{tb_flags}{te_flags}{sep}"
+        f"--max_train_epochs {max_train_epochs}{sep}"
+        f"--save_every_n_epochs {save_every_n_epochs}{sep}"
+        f"--dataset_config {dataset_config}{sep}"
+        f"--output_dir {output_dir}{sep}"
+        f"--output_name {output_name}{sep}"
+        f"--timestep_sampling {timestep_sampling}{sep}"
+        f"{flow_block}{sep}"
+        f"--guidance_scale {guidance_scale}{sep}"
+        f"--loss_type l2{noise_flag}{dropout_flag}{rank_dropout_flag}{module_dropout_flag}\n"
+    )
 
     if advanced_flags:
-        advanced_flags_str = f" {line_break}\n  ".join(advanced_flags)
+        advanced_flags_str = sep.join(advanced_flags)
         sh = sh + "\n  " + advanced_flags_str
     return sh
 
@@ -342,49 +601,42 @@ def gen_toml(
     bucket_no_upscale: bool | None = False,
     resize_interpolation: str | None = None,
 ):
-    lines: list[str] = []
-    lines.append('[general]')
-    lines.append('shuffle_caption = false')
-    lines.append("caption_extension = '.txt'")
-    lines.append('keep_tokens = 1')
-
-    lines.append('')
-    lines.append('[[datasets]]')
-    lines.append(f'resolution = {resolution}')
-    lines.append(f'batch_size = {train_batch_size}')
-    lines.append('keep_tokens = 1')
-    if enable_bucket:
-        lines.append('enable_bucket = true')
-        if min_bucket_reso is not None:
-            lines.append(f'min_bucket_reso = {int(min_bucket_reso)}')
-        if max_bucket_reso is not None:
-            lines.append(f'max_bucket_reso = {int(max_bucket_reso)}')
-        if bucket_reso_steps is not None:
-            lines.append(f'bucket_reso_steps = {int(bucket_reso_steps)}')
-        if bucket_no_upscale:
-            lines.append('bucket_no_upscale = true')
-    if resize_interpolation:
-        lines.append(f"resize_interpolation = '{resize_interpolation}'")
-
-    lines.append('')
-    lines.append('[[datasets.subsets]]')
-    lines.append(f"image_dir = '{resolve_path_without_quotes(dataset_folder)}'")
-    if class_tokens:
-        ct = str(class_tokens).strip().strip(',')
-        if ct:
-            lines.append(f"class_tokens = '{ct}'")
-    lines.append(f'num_repeats = {num_repeats}')
-    lines.append(f'flip_aug = {str(bool(flip_aug)).lower()}')
-
-    return '\n'.join(lines) + '\n'
+    ct = str(class_tokens).strip().strip(',') if class_tokens else ""
+    bucket = bool(enable_bucket)
+    # One tuple literal; None marks a line that is left out ('' is a real blank line)
+    lines = (
+        '[general]',
+        'shuffle_caption = false',
+        "caption_extension = '.txt'",
+        'keep_tokens = 1',
+        '',
+        '[[datasets]]',
+        f'resolution = {resolution}',
+        f'batch_size = {train_batch_size}',
+        'keep_tokens = 1',
+        'enable_bucket = true' if bucket else None,
+        f'min_bucket_reso = {int(min_bucket_reso)}' if bucket and min_bucket_reso is not None else None,
+        f'max_bucket_reso = {int(max_bucket_reso)}' if bucket and max_bucket_reso is not None else None,
+        f'bucket_reso_steps = {int(bucket_reso_steps)}' if bucket and bucket_reso_steps is not None else None,
+        'bucket_no_upscale = true' if bucket and bucket_no_upscale else None,
+        f"resize_interpolation = '{resize_interpolation}'" if resize_interpolation else None,
+        '',
+        '[[datasets.subsets]]',
+        f"image_dir = '{resolve_path_without_quotes(dataset_folder)}'",
+        f"class_tokens = '{ct}'" if ct else None,
+        f'num_repeats = {num_repeats}',
+        f'flip_aug = {str(bool(flip_aug)).lower()}',
+    )
+    return '\n'.join(line for line in lines if line is not None) + '\n'
 
 
 def get_loras():
     try:
         outputs_path = resolve_path_without_quotes("outputs")
-        files = os.listdir(outputs_path)
-        folders = [os.path.join(outputs_path, item) for item in files if os.path.isdir(os.path.join(outputs_path, item)) and item != "sample"]
-        folders.sort(key=lambda file: os.path.getctime(file), reverse=True)
-        return folders
+        # One scandir pass; the ctime is read once per folder, not once per sort key call
+        with os.scandir(outputs_path) as it:
+            entries = [(e.path, e.stat().st_ctime) for e in it if e.name != "sample" and e.is_dir()]
+        entries.sort(key=itemgetter(1), reverse=True)
+        return [path for path, _ in entries]
     except Exception:
         return []